@@ -6,9 +6,11 @@ Ajd Benefit Optimizer DAG
 1. offers, contracts 데이터 로드
 2. 데이터 정제 및 중복 제거
 3. 스코어링 및 최적 조합 계산
-4. SQLite DB 저장
-5. 리포트 생성
-6. KPI 출력
+4. 직전 실행 대비 추천/계약 변경분 계산
+5. SQLite DB 저장 (변경분만)
+6. 추천 이력 파티션 및 일별 롤업 저장 (최적화 태스크가 스테이징한 스냅샷을 이동)
+7. 리포트 및 변경 피드 생성
+8. KPI 출력
 """
 
 from datetime import datetime, timedelta
@@ -20,12 +22,16 @@ from airflow.operators.python import PythonOperator
 from airflow.utils.dates import days_ago
 
 # lib 모듈 import
-from lib.io_utils import (
-    load_json_files, save_to_sqlite, create_database_schema,
-    export_to_csv, export_summary_md
+from lib.io_utils import load_json_files, save_to_sqlite, create_database_schema
+from lib.rules import to_as_of_date
+from lib.history import write_partition, read_partition_file, publish_partition, history_retention_days
+from lib.delta import (
+    create_delta_schema, load_digests, load_latest_run_date, compute_recommendation_delta, apply_delta,
+    load_contract_rows, compute_contract_delta, apply_contract_delta, summarize_delta
 )
-from lib.rules import deduplicate_offers, validate_offer_data
-from lib.scoring import find_optimal_combination, calculate_kpi_metrics, prepare_recommendations_data
+from lib.scoring import build_contract_features, build_offer_catalog
+from lib.pipeline import prepare_offers, optimize_population, export_run_reports
+from lib.vendors import VendorCatalog
 
 # 기본 설정
 BASE_DIR = Path(__file__).parent.parent  # airflow-home 디렉토리
@@ -33,7 +39,10 @@ DATA_DIR = BASE_DIR / "data"
 OFFERS_DIR = DATA_DIR / "offers"
 CONTRACTS_DIR = DATA_DIR / "contracts"
 EXPORT_DIR = DATA_DIR / "export"
+HISTORY_DIR = DATA_DIR / "history"
+SNAPSHOT_DIR = HISTORY_DIR / "staging"  # 기준일 추천 스냅샷 (save_history에서 HISTORY_DIR로 이동)
 DB_PATH = DATA_DIR / "ajd.db"
+VENDOR_ALIASES_PATH = DATA_DIR / "vendor_aliases.json"  # 벤더 별칭 테이블 (없으면 기본 테이블)
 
 # DAG 기본 인수
 default_args = {
@@ -59,6 +68,11 @@ dag = DAG(
 )
 
 
+def get_as_of(context):
+    """실행 기준일: Airflow logical date (재실행 시에도 동일)"""
+    return to_as_of_date(context.get('logical_date') or context.get('execution_date'))
+
+
 def extract_offers(**context):
     """Task 1: offers 데이터 로드"""
     offers_data = load_json_files(str(OFFERS_DIR))
@@ -85,9 +99,8 @@ def transform_clean(**context):
     offers_raw = context['task_instance'].xcom_pull(key='offers_raw', task_ids='extract_offers')
     contracts_raw = context['task_instance'].xcom_pull(key='contracts_raw', task_ids='extract_contracts')
     
-    # offers 정제
-    offers_valid = validate_offer_data(offers_raw)
-    offers_clean = deduplicate_offers(offers_valid)
+    # offers 정제 (벤더 카탈로그는 실행당 1회 생성, 이후 태스크는 XCom으로 공유)
+    offers_valid, offers_clean, vendor_catalog = prepare_offers(offers_raw, contracts_raw, str(VENDOR_ALIASES_PATH))
     offers_df = pd.DataFrame(offers_clean)
     
     # conditions 리스트를 문자열로 변환 (SQLite 저장용)
@@ -102,7 +115,9 @@ def transform_clean(**context):
     # XCom에 저장
     context['task_instance'].xcom_push(key='offers_df', value=offers_df.to_dict('records'))
     context['task_instance'].xcom_push(key='contracts_df', value=contracts_df.to_dict('records'))
+    context['task_instance'].xcom_push(key='offers_valid', value=offers_valid)
     context['task_instance'].xcom_push(key='offers_clean', value=offers_clean)
+    context['task_instance'].xcom_push(key='vendor_catalog', value=vendor_catalog.to_dict())
     
     return f"Transformed {len(offers_clean)} unique offers, {len(contracts_raw)} contracts"
 
@@ -110,70 +125,124 @@ def transform_clean(**context):
 def score_and_optimize(**context):
     """Task 4: 스코어링 및 최적 조합 계산"""
     # XCom에서 데이터 가져오기
+    offers_valid = context['task_instance'].xcom_pull(key='offers_valid', task_ids='transform_clean')
     offers_clean = context['task_instance'].xcom_pull(key='offers_clean', task_ids='transform_clean')
     contracts_df = context['task_instance'].xcom_pull(key='contracts_df', task_ids='transform_clean')
+    vendor_catalog = VendorCatalog.from_dict(
+        context['task_instance'].xcom_pull(key='vendor_catalog', task_ids='transform_clean')
+    )
     
-    # 최적화 실행
-    optimization_result = find_optimal_combination(offers_clean, contracts_df)
-    
-    # KPI 계산
-    kpi_data = calculate_kpi_metrics(offers_clean, optimization_result)
-    
-    # 추천 데이터 준비
-    recommendations = prepare_recommendations_data(optimization_result)
+    # 전체 사용자 최적화 및 KPI 집계 (backfill과 동일한 기준일 단위 처리)
+    result = optimize_population(
+        build_contract_features(contracts_df, vendor_catalog), build_offer_catalog(offers_clean, vendor_catalog),
+        offers_valid, offers_clean, get_as_of(context), vendor_catalog
+    )
+    optimization_result = result['best_bundle']
     
     print(f"Optimization complete: {optimization_result['selected_count']} offers selected")
     print(f"Total benefit: {optimization_result['total_score']:,} won")
     
+    # 전체 사용자 추천 스냅샷은 파일로 한 번만 저장하고 XCom에는 경로만 전달
+    snapshot_path = write_partition(result['recommendations'], get_as_of(context), str(SNAPSHOT_DIR))
+    
     # XCom에 저장
     context['task_instance'].xcom_push(key='best_bundle', value=optimization_result)
-    context['task_instance'].xcom_push(key='kpi', value=kpi_data)
-    context['task_instance'].xcom_push(key='recommendations', value=recommendations)
+    context['task_instance'].xcom_push(key='kpi', value=result['kpi'])
+    context['task_instance'].xcom_push(key='snapshot_path', value=snapshot_path)
     
     return f"Optimized to {optimization_result['total_score']:,} won total benefit"
 
 
-def load_to_sqlite(**context):
-    """Task 5: SQLite DB에 데이터 저장"""
+def diff_recommendations(**context):
+    """Task 5: 직전 실행 대비 추천/계약 변경분 계산"""
     # XCom에서 데이터 가져오기
-    offers_df_data = context['task_instance'].xcom_pull(key='offers_df', task_ids='transform_clean')
+    snapshot_path = context['task_instance'].xcom_pull(key='snapshot_path', task_ids='score_and_optimize')
     contracts_df_data = context['task_instance'].xcom_pull(key='contracts_df', task_ids='transform_clean')
-    recommendations = context['task_instance'].xcom_pull(key='recommendations', task_ids='score_and_optimize')
-    
-    # DataFrame 생성
-    offers_df = pd.DataFrame(offers_df_data)
-    contracts_df = pd.DataFrame(contracts_df_data)
-    recommendations_df = pd.DataFrame(recommendations)
+    recommendations = read_partition_file(snapshot_path)
     
     # 데이터베이스 스키마 생성
     create_database_schema(str(DB_PATH))
+    create_delta_schema(str(DB_PATH))
+    
+    # 사용자별 번들 다이제스트 비교
+    delta = compute_recommendation_delta(
+        recommendations, load_digests(str(DB_PATH)), get_as_of(context), load_latest_run_date(str(DB_PATH))
+    )
+    delta_summary = summarize_delta(delta)
+    print(f"Recommendation delta: {delta_summary}")
+    
+    # 계약 행이 바뀐 사용자 (과거 기준일 재실행이면 현재 상태를 건드리지 않음)
+    if delta['skipped']:
+        contract_delta = {'total_users': 0, 'writes': []}
+    else:
+        contract_delta = compute_contract_delta(contracts_df_data, load_contract_rows(str(DB_PATH)))
+    print(f"Contract delta: {len(contract_delta['writes'])} users changed")
+    
+    # XCom에 저장
+    context['task_instance'].xcom_push(key='recommendation_delta', value=delta)
+    context['task_instance'].xcom_push(key='delta_summary', value=delta_summary)
+    context['task_instance'].xcom_push(key='contract_delta', value=contract_delta)
+    
+    return f"Diffed {delta['total_users']} users: {len(delta['changes'])} changes"
+
+
+def load_to_sqlite(**context):
+    """Task 6: SQLite DB에 데이터 저장 (계약/추천은 변경분만)"""
+    # XCom에서 데이터 가져오기
+    offers_df_data = context['task_instance'].xcom_pull(key='offers_df', task_ids='transform_clean')
+    contract_delta = context['task_instance'].xcom_pull(key='contract_delta', task_ids='diff_recommendations')
+    delta = context['task_instance'].xcom_pull(key='recommendation_delta', task_ids='diff_recommendations')
+    
+    # DataFrame 생성 (오퍼 카탈로그는 사용자 수와 무관하므로 전체 교체)
+    offers_df = pd.DataFrame(offers_df_data)
     
     # 데이터 저장
     save_to_sqlite(offers_df, 'offers', str(DB_PATH))
-    save_to_sqlite(contracts_df, 'contracts', str(DB_PATH))
-    save_to_sqlite(recommendations_df, 'recommendations', str(DB_PATH))
+    changed_contract_users = apply_contract_delta(contract_delta, str(DB_PATH))
+    written_rows = apply_delta(delta, str(DB_PATH))
+    
+    return (f"Saved to database: {len(offers_df)} offers, {changed_contract_users} changed contract users, "
+            f"{written_rows} changed recommendation rows")
+
+
+def save_history(**context):
+    """Task 7: 추천 이력 파티션 및 일별 롤업 저장 (기준일 전체 스냅샷)"""
+    # XCom에서 데이터 가져오기
+    snapshot_path = context['task_instance'].xcom_pull(key='snapshot_path', task_ids='score_and_optimize')
+    delta = context['task_instance'].xcom_pull(key='recommendation_delta', task_ids='diff_recommendations')
+    vendor_catalog = VendorCatalog.from_dict(
+        context['task_instance'].xcom_pull(key='vendor_catalog', task_ids='transform_clean')
+    )
+    
+    # 과거 기준일 재실행은 backfill로만 재계산
+    if delta['skipped']:
+        Path(snapshot_path).unlink(missing_ok=True)
+        return f"History not saved: {delta['run_date']} is before the latest applied run date"
+    
+    # 스테이징된 스냅샷을 파티션으로 이동 (추천 행을 다시 쓰지 않음)
+    path = publish_partition(
+        snapshot_path, get_as_of(context), str(HISTORY_DIR), str(DB_PATH), history_retention_days(), vendor_catalog
+    )
     
-    return f"Saved to database: {len(offers_df)} offers, {len(contracts_df)} contracts, {len(recommendations_df)} recommendations"
+    return f"History saved: {path}"
 
 
 def export_reports(**context):
-    """Task 6: CSV/MD 리포트 생성"""
+    """Task 8: 변경 피드/MD 리포트 생성"""
     # XCom에서 데이터 가져오기
-    recommendations = context['task_instance'].xcom_pull(key='recommendations', task_ids='score_and_optimize')
+    delta = context['task_instance'].xcom_pull(key='recommendation_delta', task_ids='diff_recommendations')
     kpi_data = context['task_instance'].xcom_pull(key='kpi', task_ids='score_and_optimize')
     
     # 리포트 생성
-    EXPORT_DIR.mkdir(exist_ok=True)
+    feed_path, md_path = export_run_reports(delta, kpi_data, str(EXPORT_DIR), get_as_of(context))
     
-    csv_path = export_to_csv({'recommendations': recommendations}, str(EXPORT_DIR))
-    md_path = export_summary_md(kpi_data, str(EXPORT_DIR))
-    
-    return f"Reports exported: {csv_path}, {md_path}"
+    return f"Reports exported: {feed_path}, {md_path}"
 
 
 def print_kpi(**context):
-    """Task 7: KPI 로그 출력"""
+    """Task 9: KPI 로그 출력"""
     kpi_data = context['task_instance'].xcom_pull(key='kpi', task_ids='score_and_optimize')
+    delta_summary = context['task_instance'].xcom_pull(key='delta_summary', task_ids='diff_recommendations')
     
     print("=" * 50)
     print("🎯 아정당 혜택 최적화 결과")
@@ -190,6 +259,26 @@ def print_kpi(**context):
         for category, details in kpi_data['category_breakdown'].items():
             print(f"  • {category}: {details['selected_offer']} ({details['benefit']:,}원)")
     
+    population = kpi_data.get('population')
+    if population:
+        quantiles = population['benefit_quantiles']
+        print("\n👥 전체 사용자 KPI:")
+        print(f"  • 사용자 수: {population['users']}명")
+        print(f"  • 평균 혜택: {population['avg_benefit']:,.0f}원")
+        print(f"  • 혜택 분포: p50 {quantiles['p50']:,.0f}원 / p90 {quantiles['p90']:,.0f}원 / p99 {quantiles['p99']:,.0f}원")
+        print(f"  • 번들 선택률: {population['bundle_uptake']:.1f}%")
+        for offer_id, share in list(population['offer_share'].items())[:5]:
+            print(f"  • 오퍼 {offer_id}: {share['count']}건 ({share['share']:.1f}%)")
+        for vendor, share in population['vendor_share'].items():
+            print(f"  • 벤더 {vendor}: {share['count']}건 ({share['share']:.1f}%)")
+    
+    if delta_summary and delta_summary['skipped']:
+        print("\n🔄 추천 변경분: 과거 기준일 재실행으로 반영하지 않음 (lib.backfill 사용)")
+    elif delta_summary:
+        print("\n🔄 추천 변경분:")
+        print(f"  • 신규 {delta_summary['insert']}명 / 변경 {delta_summary['update']}명 / "
+              f"만료 {delta_summary['expire']}명 / 유지 {delta_summary['unchanged']}명")
+    
     print("=" * 50)
     
     return "KPI logging completed"
@@ -220,12 +309,24 @@ score_and_optimize_task = PythonOperator(
     dag=dag
 )
 
+diff_recommendations_task = PythonOperator(
+    task_id='diff_recommendations',
+    python_callable=diff_recommendations,
+    dag=dag
+)
+
 load_to_sqlite_task = PythonOperator(
     task_id='load_to_sqlite',
     python_callable=load_to_sqlite,
     dag=dag
 )
 
+save_history_task = PythonOperator(
+    task_id='save_history',
+    python_callable=save_history,
+    dag=dag
+)
+
 export_reports_task = PythonOperator(
     task_id='export_reports',
     python_callable=export_reports,
@@ -241,5 +342,7 @@ print_kpi_task = PythonOperator(
 # Task 의존성 설정
 [extract_offers_task, extract_contracts_task] >> transform_clean_task
 transform_clean_task >> score_and_optimize_task
-score_and_optimize_task >> [load_to_sqlite_task, export_reports_task]
-[load_to_sqlite_task, export_reports_task] >> print_kpi_task
+score_and_optimize_task >> diff_recommendations_task
+diff_recommendations_task >> [load_to_sqlite_task, export_reports_task]
+load_to_sqlite_task >> save_history_task  # 같은 SQLite 파일에 쓰므로 순차 실행
+[save_history_task, export_reports_task] >> print_kpi_task
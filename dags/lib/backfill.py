@@ -0,0 +1,134 @@
+"""
+In-process backfill for Ajd Benefit Optimizer
+여러 기준일(as_of)을 하나의 프로세스에서 일괄 재계산
+
+데이터는 한 번만 로드하고, 파싱된 계약 피처와 오퍼 카탈로그를 모든 기준일에서 공유한다.
+기준일별 처리(최적화 -> 추천 -> KPI -> 이력 -> 리포트)는 DAG와 같은 lib.pipeline 단계를 사용하며,
+결과는 이력 파티션/일별 롤업과 날짜별 변경 피드/요약 파일로 멱등하게 저장된다.
+변경 피드는 직전 기준일의 추천 결과와 비교하여 만들고, 현재 상태 테이블(recommendations 등)은 건드리지 않는다.
+피드/요약은 DAG 리포트를 덮어쓰지 않도록 별도 디렉토리(export/backfill)에 저장한다.
+
+    cd dags
+    python -m lib.backfill --start 2025-09-01 --end 2025-09-30
+"""
+import argparse
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Any
+
+from .delta import compute_recommendation_delta, digests_from_recommendations
+from .history import save_run_history, history_retention_days, load_partition, partition_path
+from .io_utils import load_json_files, create_database_schema
+from .pipeline import HEADLINE_USER_ID, prepare_offers, optimize_population, export_run_reports
+from .rules import AsOf, to_as_of_date
+from .scoring import build_contract_features, build_offer_catalog
+
+# 기본 경로 (DAG와 동일한 airflow-home 구조)
+BASE_DIR = Path(__file__).parent.parent.parent
+DATA_DIR = BASE_DIR / "data"
+OFFERS_DIR = DATA_DIR / "offers"
+CONTRACTS_DIR = DATA_DIR / "contracts"
+EXPORT_DIR = DATA_DIR / "export" / "backfill"  # DAG 변경 피드(export/)와 분리
+HISTORY_DIR = DATA_DIR / "history"
+VENDOR_ALIASES_PATH = DATA_DIR / "vendor_aliases.json"
+DB_PATH = DATA_DIR / "ajd.db"
+
+
+def date_range(start: AsOf, end: AsOf) -> List[date]:
+    """
+    시작일~종료일(포함) 날짜 목록
+    """
+    start_date = to_as_of_date(start)
+    end_date = to_as_of_date(end)
+    if end_date < start_date:
+        raise ValueError(f"end date {end_date} is before start date {start_date}")
+
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def run_backfill(start: AsOf, end: AsOf, offers_dir: str = str(OFFERS_DIR), contracts_dir: str = str(CONTRACTS_DIR),
+                 db_path: str = str(DB_PATH), export_dir: str = str(EXPORT_DIR),
+                 params: Dict[str, Any] = None, user_id: str = HEADLINE_USER_ID,
+                 history_dir: str = str(HISTORY_DIR), retention_days: int = None,
+                 vendor_aliases_path: str = str(VENDOR_ALIASES_PATH)) -> List[Dict[str, Any]]:
+    """
+    기준일 범위에 대해 최적화/KPI/저장을 한 프로세스에서 수행
+
+    user_id는 리포트의 대표 사용자(최적 조합 섹션)로, DAG 기본값과 동일하다.
+    retention_days를 생략하면 DAG와 같은 보관 기간(history_retention_days())을 사용한다.
+    """
+    if retention_days is None:
+        retention_days = history_retention_days()
+
+    # 데이터 로드 및 정제 (1회)
+    offers_raw = load_json_files(offers_dir)
+    contracts = load_json_files(contracts_dir)
+    offers_valid, offers_clean, vendor_catalog = prepare_offers(offers_raw, contracts, vendor_aliases_path)
+    print(f"Loaded {len(offers_raw)} offers, {len(contracts)} contracts for backfill")
+
+    # 기준일 간 공유되는 피처/카탈로그
+    contract_features = build_contract_features(contracts, vendor_catalog)
+    offer_catalog = build_offer_catalog(offers_clean, vendor_catalog)
+
+    create_database_schema(db_path)
+
+    # 첫 기준일의 변경 피드는 전날 이력 파티션과 비교
+    # 파티션이 없으면(최초 실행, 보관 기간 경과) 전 사용자가 insert로 나오므로 첫 기준일 피드는 쓰지 않음
+    dates = date_range(start, end)
+    previous_date = dates[0] - timedelta(days=1)
+    previous_digests = None
+    if partition_path(history_dir, previous_date).exists():
+        previous_digests = digests_from_recommendations(load_partition(history_dir, previous_date), previous_date)
+    else:
+        print(f"No history partition for {previous_date.isoformat()}: change feed for {dates[0].isoformat()} not written")
+
+    run_summaries = []
+    for as_of in dates:
+        result = optimize_population(
+            contract_features, offer_catalog, offers_valid, offers_clean, as_of, vendor_catalog, params, user_id
+        )
+        recommendations = result['recommendations']
+
+        save_run_history(recommendations, as_of, history_dir, db_path, retention_days, vendor_catalog)
+        delta = None
+        if previous_digests is not None:
+            delta = compute_recommendation_delta(recommendations, previous_digests, as_of)
+        export_run_reports(delta, result['kpi'], export_dir, as_of)
+        previous_digests = digests_from_recommendations(recommendations, as_of)
+
+        run_summaries.append({
+            'as_of': as_of.isoformat(),
+            'users': result['users'],
+            'recommendations': len(recommendations),
+            'changes': len(delta['changes']) if delta else None,
+            'total_benefit': result['kpi']['population']['total_benefit']
+        })
+
+    print(f"Backfill complete: {len(run_summaries)} dates")
+    return run_summaries
+
+
+def main(argv: List[str] = None) -> None:
+    """
+    CLI: python -m lib.backfill --start YYYY-MM-DD --end YYYY-MM-DD
+    """
+    parser = argparse.ArgumentParser(description='아정당 혜택 최적화 기준일 범위 백필')
+    parser.add_argument('--start', required=True, help='시작 기준일 (YYYY-MM-DD)')
+    parser.add_argument('--end', required=True, help='종료 기준일 (YYYY-MM-DD, 포함)')
+    parser.add_argument('--offers-dir', default=str(OFFERS_DIR))
+    parser.add_argument('--contracts-dir', default=str(CONTRACTS_DIR))
+    parser.add_argument('--db-path', default=str(DB_PATH))
+    parser.add_argument('--export-dir', default=str(EXPORT_DIR))
+    parser.add_argument('--history-dir', default=str(HISTORY_DIR))
+    parser.add_argument('--retention-days', type=int, default=None,
+                        help='추천 이력 파티션 보관 기간 (일, 기본: AJD_HISTORY_RETENTION_DAYS 또는 90)')
+    parser.add_argument('--vendor-aliases', default=str(VENDOR_ALIASES_PATH), help='벤더 별칭 테이블 JSON 파일')
+    args = parser.parse_args(argv)
+
+    run_backfill(args.start, args.end, args.offers_dir, args.contracts_dir, args.db_path, args.export_dir,
+                 history_dir=args.history_dir, retention_days=args.retention_days,
+                 vendor_aliases_path=args.vendor_aliases)
+
+
+if __name__ == "__main__":
+    main()
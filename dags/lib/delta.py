@@ -0,0 +1,300 @@
+"""
+Delta write path for Ajd Benefit Optimizer
+사용자별 번들 다이제스트를 비교하여 변경분(insert/update/expire)만 저장
+
+- recommendation_digests: 사용자별 최신 번들 다이제스트와 직전 다이제스트
+- recommendation_delta_runs: 델타를 반영한 기준일 목록 (변경이 없던 기준일 포함)
+- recommendations: 사용자별 현재 추천 (변경된 사용자 행만 교체)
+- contracts: 계약 행이 바뀐 사용자만 교체
+- 변경 피드: export/changes_YYYYMMDD.jsonl
+
+같은 기준일을 재실행하면 직전 기준일 상태(previous_digest)와 비교하므로 동일한 변경 피드가 생성된다.
+이미 반영된 기준일보다 과거 기준일이 들어오면(과거 DAG Run clear 등) 현재 상태를 되돌리지 않도록
+델타를 건너뛴다 (과거 기준일 재계산은 backfill 사용).
+"""
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from .rules import AsOf, to_as_of_date
+
+RECOMMENDATION_COLUMNS = (
+    'recommendation_id', 'user_id', 'offer_id', 'offer_name', 'category', 'total_benefit', 'created_at'
+)
+CONTRACT_COLUMNS = ('user_id', 'category', 'vendor', 'end_date', 'monthly_fee')
+
+
+def bundle_digest(recommendations: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    사용자 번들 다이제스트 (카테고리/오퍼/혜택 기준, 추천이 없으면 None)
+    """
+    if not recommendations:
+        return None
+
+    items = sorted((rec['category'], rec['offer_id'], rec['total_benefit']) for rec in recommendations)
+    return hashlib.blake2b(json.dumps(items).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def group_by_user(recommendations: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    추천 결과를 사용자별로 그룹화
+    """
+    grouped = {}
+    for rec in recommendations:
+        grouped.setdefault(rec['user_id'], []).append(rec)
+    return grouped
+
+
+def create_delta_schema(db_path: str) -> None:
+    """
+    델타 저장용 테이블/인덱스 생성
+    """
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS recommendation_digests (
+            user_id TEXT PRIMARY KEY,
+            digest TEXT,
+            previous_digest TEXT,
+            run_date TEXT
+        )
+        """)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS recommendation_delta_runs (
+            run_date TEXT PRIMARY KEY,
+            changes INTEGER,
+            written_users INTEGER
+        )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_recommendations_user_id ON recommendations (user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_contracts_user_id ON contracts (user_id)")
+
+
+def load_digests(db_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    저장된 사용자별 다이제스트 로드
+    """
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT user_id, digest, previous_digest, run_date FROM recommendation_digests")
+        return {
+            user_id: {'digest': digest, 'previous_digest': previous_digest, 'run_date': run_date}
+            for user_id, digest, previous_digest, run_date in rows
+        }
+
+
+def digests_from_recommendations(recommendations: List[Dict[str, Any]], run_date: AsOf) -> Dict[str, Dict[str, Any]]:
+    """
+    기준일 추천 결과 -> 사용자별 다이제스트 (DB 없이 직전 기준일과 비교할 때 사용, 예: backfill)
+    """
+    run_date_str = to_as_of_date(run_date).isoformat()
+    return {
+        user_id: {'digest': bundle_digest(user_recs), 'previous_digest': None, 'run_date': run_date_str}
+        for user_id, user_recs in group_by_user(recommendations).items()
+    }
+
+
+def load_latest_run_date(db_path: str) -> Optional[str]:
+    """
+    델타를 마지막으로 반영한 기준일 (없으면 None)
+    """
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT MAX(run_date) FROM recommendation_delta_runs").fetchone()[0]
+
+
+def compute_recommendation_delta(recommendations: List[Dict[str, Any]], stored_digests: Dict[str, Dict[str, Any]],
+                                 run_date: AsOf, latest_run_date: str = None) -> Dict[str, Any]:
+    """
+    새 추천 결과와 저장된 다이제스트 비교
+
+    changes: 직전 기준일 대비 변경 피드 (insert/update/expire)
+    writes: 현재 DB 상태 대비 실제로 다시 써야 하는 사용자 (재실행 시에도 DB를 새 결과와 일치시킴)
+    skipped: 마지막으로 반영한 기준일(latest_run_date)보다 과거 기준일이라 변경분을 만들지 않은 경우 True
+    """
+    run_date_str = to_as_of_date(run_date).isoformat()
+    by_user = group_by_user(recommendations)
+
+    applied_dates = [stored['run_date'] for stored in stored_digests.values()]
+    latest_run_date = max(filter(None, [latest_run_date, *applied_dates]), default=None)
+    if latest_run_date is not None and latest_run_date > run_date_str:
+        print(f"Skipping recommendation delta: {run_date_str} is before latest applied run date {latest_run_date} "
+              f"(use lib.backfill to rebuild past dates)")
+        return {
+            'run_date': run_date_str,
+            'total_users': len(by_user),
+            'changes': [],
+            'writes': [],
+            'skipped': True
+        }
+
+    changes = []
+    writes = []
+
+    for user_id in sorted(set(by_user) | set(stored_digests)):
+        user_recs = by_user.get(user_id, [])
+        new_digest = bundle_digest(user_recs)
+        stored = stored_digests.get(user_id)
+
+        current_digest = stored['digest'] if stored else None
+        if stored and stored['run_date'] == run_date_str:
+            base_digest = stored['previous_digest']
+        else:
+            base_digest = current_digest
+
+        if new_digest != base_digest:
+            if base_digest is None:
+                op = 'insert'
+            elif new_digest is None:
+                op = 'expire'
+            else:
+                op = 'update'
+            changes.append({
+                'op': op,
+                'user_id': user_id,
+                'run_date': run_date_str,
+                'digest': new_digest,
+                'recommendations': user_recs
+            })
+
+        if new_digest != current_digest:
+            writes.append({
+                'user_id': user_id,
+                'digest': new_digest,
+                'previous_digest': base_digest,
+                'recommendations': user_recs
+            })
+
+    return {
+        'run_date': run_date_str,
+        'total_users': len(by_user),
+        'changes': changes,
+        'writes': writes,
+        'skipped': False
+    }
+
+
+def apply_delta(delta: Dict[str, Any], db_path: str) -> int:
+    """
+    변경된 사용자만 recommendations / recommendation_digests에 반영하고 기준일을 기록 (단일 트랜잭션)
+    """
+    if delta['skipped']:
+        print(f"Recommendation delta skipped for {delta['run_date']}: nothing applied")
+        return 0
+
+    writes = delta['writes']
+    user_ids = [(write['user_id'],) for write in writes]
+    rows = [
+        tuple(rec[column] for column in RECOMMENDATION_COLUMNS)
+        for write in writes for rec in write['recommendations']
+    ]
+    digest_rows = [
+        (write['user_id'], write['digest'], write['previous_digest'], delta['run_date'])
+        for write in writes
+    ]
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("DELETE FROM recommendations WHERE user_id = ?", user_ids)
+        conn.executemany(
+            f"INSERT INTO recommendations ({', '.join(RECOMMENDATION_COLUMNS)}) VALUES ({', '.join('?' * len(RECOMMENDATION_COLUMNS))})",
+            rows
+        )
+        conn.executemany("""
+        INSERT INTO recommendation_digests (user_id, digest, previous_digest, run_date)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            digest = excluded.digest,
+            previous_digest = excluded.previous_digest,
+            run_date = excluded.run_date
+        """, digest_rows)
+        conn.execute("""
+        INSERT INTO recommendation_delta_runs (run_date, changes, written_users)
+        VALUES (?, ?, ?)
+        ON CONFLICT (run_date) DO UPDATE SET
+            changes = excluded.changes,
+            written_users = excluded.written_users
+        """, (delta['run_date'], len(delta['changes']), len(writes)))
+
+    print(f"Applied recommendation delta: {len(writes)} users, {len(rows)} rows written")
+    return len(rows)
+
+
+def load_contract_rows(db_path: str) -> Dict[str, List[Tuple]]:
+    """
+    저장된 계약 행을 사용자별로 로드 (정렬된 튜플 목록)
+    """
+    stored = {}
+    with sqlite3.connect(db_path) as conn:
+        for row in conn.execute(f"SELECT {', '.join(CONTRACT_COLUMNS)} FROM contracts"):
+            stored.setdefault(row[0], []).append(tuple(row))
+
+    return {user_id: sorted(rows) for user_id, rows in stored.items()}
+
+
+def compute_contract_delta(contracts: List[Dict[str, Any]], stored_rows: Dict[str, List[Tuple]]) -> Dict[str, Any]:
+    """
+    입력 계약과 저장된 계약 비교 -> 계약 행이 바뀐(추가/변경/삭제) 사용자만 반환
+    """
+    by_user = {}
+    for contract in contracts:
+        by_user.setdefault(contract['user_id'], []).append(tuple(contract.get(column) for column in CONTRACT_COLUMNS))
+
+    writes = []
+    for user_id in sorted(set(by_user) | set(stored_rows)):
+        rows = sorted(by_user.get(user_id, []))
+        if rows != stored_rows.get(user_id, []):
+            writes.append({'user_id': user_id, 'rows': rows})
+
+    return {'total_users': len(by_user), 'writes': writes}
+
+
+def apply_contract_delta(contract_delta: Dict[str, Any], db_path: str) -> int:
+    """
+    계약 행이 바뀐 사용자만 contracts 테이블에 반영 (단일 트랜잭션)
+    """
+    writes = contract_delta['writes']
+    if not writes:
+        print("No contract changes to apply")
+        return 0
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("DELETE FROM contracts WHERE user_id = ?", [(write['user_id'],) for write in writes])
+        conn.executemany(
+            f"INSERT INTO contracts ({', '.join(CONTRACT_COLUMNS)}) VALUES ({', '.join('?' * len(CONTRACT_COLUMNS))})",
+            [row for write in writes for row in write['rows']]
+        )
+
+    print(f"Applied contract delta: {len(writes)} users")
+    return len(writes)
+
+
+def write_change_feed(delta: Dict[str, Any], output_dir: str) -> Optional[str]:
+    """
+    변경 피드를 JSONL로 내보내기 (기준일별 파일, 재실행 시 덮어쓰기)
+
+    건너뛴 델타는 해당 기준일의 기존 피드를 덮어쓰지 않는다.
+    """
+    run_date = to_as_of_date(delta['run_date'])
+    feed_path = Path(output_dir) / f"changes_{run_date.strftime('%Y%m%d')}.jsonl"
+
+    if delta['skipped']:
+        print(f"Change feed not written for skipped delta ({delta['run_date']})")
+        return None
+
+    with open(feed_path, 'w', encoding='utf-8') as f:
+        for change in delta['changes']:
+            f.write(json.dumps(change, ensure_ascii=False) + '\n')
+
+    print(f"Change feed exported to {feed_path} ({len(delta['changes'])} changes)")
+    return str(feed_path)
+
+
+def summarize_delta(delta: Dict[str, Any]) -> Dict[str, int]:
+    """
+    변경 유형별 건수 (건너뛴 델타는 skipped=1)
+    """
+    summary = {'insert': 0, 'update': 0, 'expire': 0}
+    for change in delta['changes']:
+        summary[change['op']] += 1
+    summary['unchanged'] = delta['total_users'] - summary['insert'] - summary['update']
+    summary['skipped'] = int(delta['skipped'])
+    return summary
@@ -0,0 +1,235 @@
+"""
+Recommendation history store for Ajd Benefit Optimizer
+기준일(run_date) 단위로 파티션된 추천 이력 및 일별 롤업 테이블 관리
+
+- 원본 추천 이력: 기준일별 SQLite 파일 (history/recommendations_YYYYMMDD.db)
+  같은 기준일 재실행 시 파티션 파일을 통째로 교체하고, 보관 기간이 지난 파티션은 파일 삭제로 정리한다.
+- 일별 롤업: 메인 DB의 rollup_daily_{category,vendor,offer} 테이블
+  적재 시점에 해당 기준일 분만 갱신하므로 추세 조회 시 원본 이력을 스캔하지 않는다.
+- 보관 기간: 환경 변수 AJD_HISTORY_RETENTION_DAYS (기본 90일)
+- DAG는 최적화 태스크에서 파티션을 스테이징 디렉토리에 한 번 쓰고(XCom에는 경로만 전달),
+  이력 저장 태스크에서 publish_partition으로 파티션 위치에 옮긴다.
+"""
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any
+
+from .rules import AsOf, to_as_of_date
+from .vendors import VendorCatalog
+
+PARTITION_PATTERN = re.compile(r"^recommendations_(\d{8})\.db$")
+
+DEFAULT_RETENTION_DAYS = 90
+RETENTION_DAYS_ENV = 'AJD_HISTORY_RETENTION_DAYS'
+
+# 롤업 테이블명 -> 그룹 기준 컬럼
+ROLLUP_TABLES = {
+    'rollup_daily_category': 'category',
+    'rollup_daily_vendor': 'vendor',
+    'rollup_daily_offer': 'offer_id',
+}
+
+
+def history_retention_days() -> int:
+    """
+    추천 이력 파티션 보관 기간 (일): 환경 변수 AJD_HISTORY_RETENTION_DAYS, 없으면 기본 90일
+    """
+    value = os.environ.get(RETENTION_DAYS_ENV, '').strip()
+    if not value:
+        return DEFAULT_RETENTION_DAYS
+
+    retention_days = int(value)
+    if retention_days < 0:
+        raise ValueError(f"{RETENTION_DAYS_ENV} must be zero or positive: {value}")
+    return retention_days
+
+
+def partition_path(history_dir: str, run_date: AsOf) -> Path:
+    """
+    기준일 파티션 파일 경로
+    """
+    return Path(history_dir) / f"recommendations_{to_as_of_date(run_date).strftime('%Y%m%d')}.db"
+
+
+def list_partitions(history_dir: str) -> List[date]:
+    """
+    저장된 파티션 기준일 목록 (오름차순)
+    """
+    path = Path(history_dir)
+    if not path.exists():
+        return []
+
+    run_dates = []
+    for partition in path.iterdir():
+        match = PARTITION_PATTERN.match(partition.name)
+        if match:
+            run_dates.append(datetime.strptime(match.group(1), "%Y%m%d").date())
+
+    return sorted(run_dates)
+
+
+def write_partition(recommendations: List[Dict[str, Any]], run_date: AsOf, history_dir: str) -> str:
+    """
+    기준일 파티션 저장 (임시 파일에 쓴 뒤 교체하여 재실행 시에도 멱등)
+    """
+    target = partition_path(history_dir, run_date)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_suffix('.db.tmp')
+    if temp_path.exists():
+        temp_path.unlink()
+
+    rows = [
+        (rec['recommendation_id'], rec['user_id'], rec['offer_id'], rec['offer_name'],
+         rec['category'], rec['total_benefit'], rec['created_at'])
+        for rec in recommendations
+    ]
+
+    conn = sqlite3.connect(temp_path)
+    try:
+        conn.execute("""
+        CREATE TABLE recommendations (
+            recommendation_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            offer_id TEXT,
+            offer_name TEXT,
+            category TEXT,
+            total_benefit INTEGER,
+            created_at TEXT
+        )
+        """)
+        conn.executemany("INSERT INTO recommendations VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(temp_path, target)
+    print(f"Saved {len(rows)} records to history partition {target.name}")
+    return str(target)
+
+
+def load_partition(history_dir: str, run_date: AsOf) -> List[Dict[str, Any]]:
+    """
+    기준일 파티션의 추천 이력 로드 (파티션이 없으면 빈 리스트)
+    """
+    path = partition_path(history_dir, run_date)
+    if not path.exists():
+        return []
+
+    return read_partition_file(str(path))
+
+
+def read_partition_file(path: str) -> List[Dict[str, Any]]:
+    """
+    파티션 파일(write_partition 결과)의 추천 이력 로드
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in conn.execute("SELECT * FROM recommendations")]
+    finally:
+        conn.close()
+
+
+def drop_expired_partitions(history_dir: str, as_of: AsOf, retention_days: int) -> List[date]:
+    """
+    보관 기간이 지난 파티션 삭제 (DELETE + VACUUM 대신 파일 단위 삭제)
+    """
+    cutoff = to_as_of_date(as_of) - timedelta(days=retention_days)
+
+    dropped = []
+    for run_date in list_partitions(history_dir):
+        if run_date < cutoff:
+            partition_path(history_dir, run_date).unlink()
+            dropped.append(run_date)
+
+    if dropped:
+        print(f"Dropped {len(dropped)} history partitions older than {cutoff.isoformat()}")
+    return dropped
+
+
+def update_rollups(recommendations: List[Dict[str, Any]], run_date: AsOf, db_path: str,
+                   vendor_catalog: VendorCatalog = None) -> None:
+    """
+    기준일 분 일별 롤업 갱신 (카테고리/벤더/오퍼별 추천 수, 사용자 수, 총 혜택)
+
+    vendor_catalog를 생략하면 기본 별칭 테이블로 호출 단위 카탈로그를 새로 만든다.
+    """
+    run_date_str = to_as_of_date(run_date).isoformat()
+    vendor_catalog = vendor_catalog or VendorCatalog()
+
+    with sqlite3.connect(db_path) as conn:
+        for table, column in ROLLUP_TABLES.items():
+            conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                run_date TEXT,
+                {column} TEXT,
+                recommendation_count INTEGER,
+                user_count INTEGER,
+                total_benefit INTEGER,
+                PRIMARY KEY (run_date, {column})
+            )
+            """)
+
+            groups = defaultdict(lambda: {'count': 0, 'users': set(), 'benefit': 0})
+            for rec in recommendations:
+                if column == 'vendor':
+                    key = vendor_catalog.offer_vendor_name({'id': rec['offer_id'], 'name': rec['offer_name']})
+                else:
+                    key = rec[column]
+                groups[key]['count'] += 1
+                groups[key]['users'].add(rec['user_id'])
+                groups[key]['benefit'] += rec['total_benefit']
+
+            conn.execute(f"DELETE FROM {table} WHERE run_date = ?", (run_date_str,))
+            conn.executemany(
+                f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?)",
+                [
+                    (run_date_str, key, group['count'], len(group['users']), group['benefit'])
+                    for key, group in groups.items()
+                ]
+            )
+
+        print(f"Updated daily rollups for {run_date_str}")
+
+
+def publish_partition(snapshot_path: str, run_date: AsOf, history_dir: str, db_path: str,
+                      retention_days: int = None, vendor_catalog: VendorCatalog = None) -> str:
+    """
+    스테이징된 기준일 스냅샷을 파티션으로 교체 + 롤업 갱신 + (선택) 보관 기간 정리
+
+    snapshot_path는 write_partition(recommendations, run_date, staging_dir)의 결과이며,
+    같은 파일시스템 안에서 파일 이동만 하므로 추천 행을 다시 쓰지 않는다.
+    이미 옮겨진 스냅샷(태스크 재시도)은 파티션에서 다시 읽어 롤업/정리만 수행한다.
+    """
+    target = partition_path(history_dir, run_date)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if Path(snapshot_path).exists():
+        os.replace(snapshot_path, target)
+
+    recommendations = read_partition_file(str(target))
+    print(f"Published history partition {target.name} ({len(recommendations)} records)")
+
+    update_rollups(recommendations, run_date, db_path, vendor_catalog)
+
+    if retention_days is not None:
+        drop_expired_partitions(history_dir, run_date, retention_days)
+
+    return str(target)
+
+
+def save_run_history(recommendations: List[Dict[str, Any]], run_date: AsOf, history_dir: str, db_path: str,
+                     retention_days: int = None, vendor_catalog: VendorCatalog = None) -> str:
+    """
+    기준일 추천 이력 저장: 파티션 교체 + 롤업 갱신 + (선택) 보관 기간 정리
+    """
+    path = write_partition(recommendations, run_date, history_dir)
+    update_rollups(recommendations, run_date, db_path, vendor_catalog)
+
+    if retention_days is not None:
+        drop_expired_partitions(history_dir, run_date, retention_days)
+
+    return path
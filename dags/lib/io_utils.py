@@ -7,7 +7,7 @@ import sqlite3
 import pandas as pd
 from pathlib import Path
 from typing import List, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 
 
 def load_json_files(directory: str, pattern: str = "*.json") -> List[Dict[str, Any]]:
@@ -78,9 +78,10 @@ def create_database_schema(db_path: str) -> None:
         CREATE TABLE IF NOT EXISTS recommendations (
             recommendation_id TEXT PRIMARY KEY,
             user_id TEXT,
-            offer_ids TEXT,
+            offer_id TEXT,
+            offer_name TEXT,
+            category TEXT,
             total_benefit INTEGER,
-            total_score REAL,
             created_at TEXT
         )
         """)
@@ -106,11 +107,35 @@ def export_to_csv(data: Dict[str, Any], output_dir: str) -> str:
     return ""
 
 
-def export_summary_md(kpi_data: Dict[str, Any], output_dir: str) -> str:
+def _format_population_md(population: Dict[str, Any]) -> str:
     """
-    KPI 요약을 마크다운으로 내보내기
+    전체 사용자 KPI를 마크다운 목록/표로 변환
     """
-    timestamp = datetime.now().strftime("%Y%m%d")
+    if not population:
+        return '데이터 없음'
+    
+    quantiles = ' / '.join(f"{name} {value:,.0f}원" for name, value in population['benefit_quantiles'].items())
+    lines = [
+        f"- 사용자 수: {population['users']}명",
+        f"- 평균 혜택: {population['avg_benefit']:,.0f}원 (최소 {population['min_benefit']:,.0f}원, 최대 {population['max_benefit']:,.0f}원)",
+        f"- 혜택 분위수: {quantiles}",
+        f"- 번들 선택률: {population['bundle_uptake']:.1f}% ({population['bundle_users']}명)",
+        "",
+        "| 구분 | 항목 | 선택 수 | 비중 |",
+        "|---|---|---:|---:|",
+    ]
+    for label, key in (('오퍼', 'offer_share'), ('벤더', 'vendor_share')):
+        for name, share in population[key].items():
+            lines.append(f"| {label} | {name} | {share['count']} | {share['share']:.1f}% |")
+    
+    return '\n'.join(lines)
+
+
+def export_summary_md(kpi_data: Dict[str, Any], output_dir: str, report_date: date = None) -> str:
+    """
+    KPI 요약을 마크다운으로 내보내기 (report_date 지정 시 해당 날짜 파일명 사용)
+    """
+    timestamp = (report_date or datetime.now()).strftime("%Y%m%d")
     md_path = Path(output_dir) / f"summary_{timestamp}.md"
     
     summary = f"""# 아정당 혜택 최적화 리포트 ({timestamp})
@@ -127,6 +152,9 @@ def export_summary_md(kpi_data: Dict[str, Any], output_dir: str) -> str:
 ## 카테고리별 분석
 {kpi_data.get('category_breakdown', '데이터 없음')}
 
+## 전체 사용자 KPI
+{_format_population_md(kpi_data.get('population'))}
+
 ---
 *생성일시: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}*
 """
@@ -0,0 +1,315 @@
+"""
+Streaming KPI aggregation for Ajd Benefit Optimizer
+전체 사용자 KPI를 단일 패스로 집계하는 병합 가능한 스케치
+
+- HyperLogLog: 고유 오퍼/사용자 수 추정 (소규모 구간은 정확한 값)
+- TDigest: 혜택 분포 및 분위수 추정
+샤드별 집계 결과는 merge()로 합칠 수 있고, to_dict()/from_dict()로 XCom에 저장할 수 있다.
+"""
+import base64
+import hashlib
+import math
+from collections import Counter
+from typing import Dict, List, Any, Iterable
+
+from .vendors import VendorCatalog
+
+
+class HyperLogLog:
+    """
+    고유 원소 수 추정용 HyperLogLog 스케치
+
+    원소 수가 exact_limit(기본 2^precision) 이하인 동안은 해시 집합도 함께 유지하여 정확한 값을 반환한다.
+    중복이 없는 소규모 피드에서 추정 오차로 중복률이 생기지 않도록 하기 위함이다.
+    """
+
+    def __init__(self, precision: int = 14, exact_limit: int = None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"precision must be between 4 and 16: {precision}")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self.exact_limit = (1 << precision) if exact_limit is None else exact_limit
+        self.exact = set()  # 정확 집계용 해시 집합 (exact_limit 초과 시 None)
+
+    def add(self, value: Any) -> None:
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        if self.exact is not None:
+            self.exact.add(hashed)
+            if len(self.exact) > self.exact_limit:
+                self.exact = None
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        if self.exact is not None and other.exact is not None:
+            self.exact |= other.exact
+            if len(self.exact) > self.exact_limit:
+                self.exact = None
+        else:
+            self.exact = None
+        return self
+
+    def estimate(self) -> int:
+        if self.exact is not None:
+            return len(self.exact)
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # 소규모 구간 보정 (linear counting)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'precision': self.precision,
+            'registers': base64.b64encode(bytes(self.registers)).decode('ascii'),
+            'exact_limit': self.exact_limit,
+            'exact': sorted(self.exact) if self.exact is not None else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HyperLogLog':
+        sketch = cls(data['precision'], data['exact_limit'])
+        sketch.registers = bytearray(base64.b64decode(data['registers']))
+        sketch.exact = set(data['exact']) if data['exact'] is not None else None
+        return sketch
+
+
+class TDigest:
+    """
+    분위수 추정용 merging t-digest 스케치
+    """
+
+    def __init__(self, compression: int = 100):
+        self.compression = compression
+        self.centroids = []  # [mean, weight] (mean 기준 정렬)
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    def add(self, value: float, weight: float = 1) -> None:
+        self._buffer.append([float(value), weight])
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def merge(self, other: 'TDigest') -> 'TDigest':
+        other._compress()
+        self._buffer.extend([mean, weight] for mean, weight in other.centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k: float) -> float:
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def _compress(self) -> None:
+        if not self._buffer:
+            return
+
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in points)
+
+        merged = []
+        current_mean, current_weight = points[0]
+        weight_so_far = 0
+        q_limit = self._k_inverse(self._k(0) + 1)
+
+        for mean, weight in points[1:]:
+            if (weight_so_far + current_weight + weight) / total <= q_limit:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+            else:
+                merged.append([current_mean, current_weight])
+                weight_so_far += current_weight
+                q_limit = self._k_inverse(self._k(weight_so_far / total) + 1)
+                current_mean, current_weight = mean, weight
+
+        merged.append([current_mean, current_weight])
+        self.centroids = merged
+
+    def quantile(self, q: float) -> float:
+        self._compress()
+        if not self.centroids:
+            return 0.0
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        target = q * self.count
+        cumulative = 0
+        previous_mean, previous_mid = self.min, 0
+
+        for mean, weight in self.centroids:
+            mid = cumulative + weight / 2
+            if target < mid:
+                if mid == previous_mid:
+                    return mean
+                return previous_mean + (mean - previous_mean) * (target - previous_mid) / (mid - previous_mid)
+            previous_mean, previous_mid = mean, mid
+            cumulative += weight
+
+        if self.count == previous_mid:
+            return self.max
+        return previous_mean + (self.max - previous_mean) * (target - previous_mid) / (self.count - previous_mid)
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._compress()
+        return {
+            'compression': self.compression,
+            'centroids': self.centroids,
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TDigest':
+        sketch = cls(data['compression'])
+        sketch.centroids = [list(centroid) for centroid in data['centroids']]
+        sketch.count = data['count']
+        if data['count']:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+
+class KpiAggregator:
+    """
+    전체 사용자 KPI 단일 패스 집계기
+
+    add_offer()로 유효성 검증된 오퍼 스트림(중복 포함)을, add_result()로 사용자별 최적화 결과를 넣는다.
+    고유 오퍼는 deduplicate_offers와 같은 벤더 카탈로그 지문으로 센다.
+    벤더 집계 키는 벤더 카탈로그의 정규 벤더명이므로 샤드 간 병합 시에도 일치한다.
+    vendor_catalog를 생략하면 기본 별칭 테이블로 집계기 전용 카탈로그를 새로 만든다.
+    """
+
+    def __init__(self, compression: int = 100, precision: int = 14, vendor_catalog: VendorCatalog = None):
+        self.vendor_catalog = vendor_catalog or VendorCatalog()
+        self.total_offers = 0
+        self.offer_fingerprints = HyperLogLog(precision)
+        self.user_ids = HyperLogLog(precision)
+        self.benefit = TDigest(compression)
+        self.users = 0
+        self.total_benefit = 0
+        self.bundle_users = 0
+        self.offer_selections = Counter()
+        self.vendor_selections = Counter()
+        self.category_selections = Counter()
+
+    def add_offer(self, offer: Dict[str, Any]) -> None:
+        self.total_offers += 1
+        self.offer_fingerprints.add(self.vendor_catalog.offer_fingerprint(offer))
+
+    def add_offers(self, offers: Iterable[Dict[str, Any]]) -> None:
+        for offer in offers:
+            self.add_offer(offer)
+
+    def add_result(self, user_id: str, optimization_result: Dict[str, Any]) -> None:
+        self.users += 1
+        self.user_ids.add(user_id)
+        self.benefit.add(optimization_result['total_score'])
+        self.total_benefit += optimization_result['total_score']
+        if optimization_result['bundle_bonus']:
+            self.bundle_users += 1
+
+        for offer in optimization_result['selected_offers']:
+            self.offer_selections[offer['id']] += 1
+            self.vendor_selections[self.vendor_catalog.offer_vendor_name(offer)] += 1
+            self.category_selections[offer['category']] += 1
+
+    def merge(self, other: 'KpiAggregator') -> 'KpiAggregator':
+        self.total_offers += other.total_offers
+        self.offer_fingerprints.merge(other.offer_fingerprints)
+        self.user_ids.merge(other.user_ids)
+        self.benefit.merge(other.benefit)
+        self.users += other.users
+        self.total_benefit += other.total_benefit
+        self.bundle_users += other.bundle_users
+        self.offer_selections.update(other.offer_selections)
+        self.vendor_selections.update(other.vendor_selections)
+        self.category_selections.update(other.category_selections)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'total_offers': self.total_offers,
+            'offer_fingerprints': self.offer_fingerprints.to_dict(),
+            'user_ids': self.user_ids.to_dict(),
+            'benefit': self.benefit.to_dict(),
+            'users': self.users,
+            'total_benefit': self.total_benefit,
+            'bundle_users': self.bundle_users,
+            'offer_selections': dict(self.offer_selections),
+            'vendor_selections': dict(self.vendor_selections),
+            'category_selections': dict(self.category_selections)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], vendor_catalog: VendorCatalog = None) -> 'KpiAggregator':
+        aggregator = cls(vendor_catalog=vendor_catalog)
+        aggregator.total_offers = data['total_offers']
+        aggregator.offer_fingerprints = HyperLogLog.from_dict(data['offer_fingerprints'])
+        aggregator.user_ids = HyperLogLog.from_dict(data['user_ids'])
+        aggregator.benefit = TDigest.from_dict(data['benefit'])
+        aggregator.users = data['users']
+        aggregator.total_benefit = data['total_benefit']
+        aggregator.bundle_users = data['bundle_users']
+        aggregator.offer_selections = Counter(data['offer_selections'])
+        aggregator.vendor_selections = Counter(data['vendor_selections'])
+        aggregator.category_selections = Counter(data['category_selections'])
+        return aggregator
+
+    def summary(self, quantiles: List[float] = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)) -> Dict[str, Any]:
+        """
+        리포트용 KPI 요약 (비율은 % 단위)
+        """
+        unique_offers = min(self.offer_fingerprints.estimate(), self.total_offers)
+        dup_rate = ((self.total_offers - unique_offers) / self.total_offers * 100) if self.total_offers > 0 else 0
+        selection_total = sum(self.offer_selections.values())
+
+        def shares(counter: Counter) -> Dict[str, Dict[str, Any]]:
+            return {
+                key: {'count': count, 'share': count / selection_total * 100 if selection_total else 0}
+                for key, count in counter.most_common()
+            }
+
+        return {
+            'users': self.users,
+            'distinct_users': min(self.user_ids.estimate(), self.users),
+            'total_offers': self.total_offers,
+            'unique_offers': unique_offers,
+            'dup_rate': dup_rate,
+            'total_benefit': self.total_benefit,
+            'avg_benefit': self.total_benefit / self.users if self.users else 0,
+            'min_benefit': self.benefit.min if self.users else 0,
+            'max_benefit': self.benefit.max if self.users else 0,
+            'benefit_quantiles': {
+                f"p{int(round(q * 100))}": self.benefit.quantile(q) for q in quantiles
+            },
+            'bundle_users': self.bundle_users,
+            'bundle_uptake': self.bundle_users / self.users * 100 if self.users else 0,
+            'selection_total': selection_total,
+            'offer_share': shares(self.offer_selections),
+            'vendor_share': shares(self.vendor_selections),
+            'category_share': shares(self.category_selections)
+        }
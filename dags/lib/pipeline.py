@@ -0,0 +1,82 @@
+"""
+Per-date pipeline steps for Ajd Benefit Optimizer
+기준일 단위 처리 단계 (DAG 태스크와 backfill이 공통으로 사용)
+
+- prepare_offers: 오퍼 유효성 검증 -> 벤더 카탈로그 -> 중복 제거
+- optimize_population: 전체 사용자 최적화 -> 추천 데이터 -> KPI
+- export_run_reports: 변경 피드 + MD 요약
+이력 저장은 history.save_run_history, 변경분 계산은 delta.compute_recommendation_delta를 그대로 사용한다.
+"""
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from .delta import write_change_feed
+from .io_utils import export_summary_md
+from .kpi import KpiAggregator
+from .rules import AsOf, to_as_of_date, deduplicate_offers, validate_offer_data
+from .scoring import calculate_kpi_metrics, prepare_recommendations_data, evaluate_population
+from .vendors import VendorCatalog, build_vendor_catalog, load_vendor_aliases
+
+HEADLINE_USER_ID = "u001"  # 리포트 최적 조합 섹션의 대표 사용자
+
+
+def prepare_offers(offers_raw: List[Dict[str, Any]], contracts: List[Dict[str, Any]],
+                   vendor_aliases_path: str = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], VendorCatalog]:
+    """
+    오퍼 정제 -> (유효 오퍼, 중복 제거된 오퍼, 실행 단위 벤더 카탈로그)
+    """
+    offers_valid = validate_offer_data(offers_raw)
+    vendor_catalog = build_vendor_catalog(offers_valid, contracts, load_vendor_aliases(vendor_aliases_path))
+    offers_clean = deduplicate_offers(offers_valid, vendor_catalog)
+    return offers_valid, offers_clean, vendor_catalog
+
+
+def optimize_population(contract_features: Dict[str, Dict[str, Any]], offer_catalog: Dict[str, List[Dict[str, Any]]],
+                        offers_valid: List[Dict[str, Any]], offers_clean: List[Dict[str, Any]], as_of: AsOf,
+                        vendor_catalog: VendorCatalog, params: Dict[str, Any] = None,
+                        headline_user_id: str = HEADLINE_USER_ID) -> Dict[str, Any]:
+    """
+    기준일 전체 사용자 최적화 및 KPI 집계
+
+    반환값: best_bundle(대표 사용자 결과), recommendations, kpi, users
+    """
+    as_of = to_as_of_date(as_of)
+
+    # 전체 사용자 최적화 실행 (동일 프로필 사용자는 한 번만 계산)
+    population_results = evaluate_population(contract_features, offer_catalog, as_of, params)
+
+    # 대표 사용자 결과 (계약이 없는 사용자면 신규 고객 프로필로 계산)
+    best_bundle = population_results.get(headline_user_id) or evaluate_population(
+        contract_features, offer_catalog, as_of, params, user_ids=[headline_user_id]
+    )[headline_user_id]
+
+    # 전체 사용자 KPI 스트리밍 집계 (정제 전 오퍼 기준 중복률 포함)
+    aggregator = KpiAggregator(vendor_catalog=vendor_catalog)
+    aggregator.add_offers(offers_valid)
+
+    # 전체 사용자 추천 데이터 준비 (기준일 기반 결정적 ID)
+    recommendations = []
+    for user_id, user_result in population_results.items():
+        aggregator.add_result(user_id, user_result)
+        recommendations.extend(prepare_recommendations_data(user_result, user_id, as_of))
+
+    return {
+        'best_bundle': best_bundle,
+        'recommendations': recommendations,
+        'kpi': calculate_kpi_metrics(offers_clean, best_bundle, aggregator.summary()),
+        'users': len(population_results)
+    }
+
+
+def export_run_reports(delta: Optional[Dict[str, Any]], kpi_data: Dict[str, Any], export_dir: str,
+                       as_of: AsOf) -> Tuple[Optional[str], str]:
+    """
+    기준일 변경 피드/MD 요약 내보내기 -> (변경 피드 경로, MD 경로)
+
+    delta가 None이면(비교 기준 없음) 변경 피드는 쓰지 않는다.
+    """
+    Path(export_dir).mkdir(parents=True, exist_ok=True)
+
+    feed_path = write_change_feed(delta, export_dir) if delta is not None else None
+    md_path = export_summary_md(kpi_data, export_dir, report_date=to_as_of_date(as_of))
+    return feed_path, md_path
@@ -2,112 +2,222 @@
 Business rules for Ajd Benefit Optimizer
 비즈니스 룰 및 조건 검증 로직
 """
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Any, Union
 import pandas as pd
 
+from .vendors import VendorCatalog
 
-def check_eligibility(offer: Dict[str, Any], contracts: List[Dict[str, Any]], user_id: str = "u001") -> bool:
+AsOf = Union[str, date, datetime, None]
+
+
+# 룰 파라미터 기본값 (시나리오 시뮬레이션에서 부분적으로 덮어쓸 수 있음)
+DEFAULT_RULE_PARAMS = {
+    'expiry_window_days': 60,        # 만료 임박 기준 일수
+    'termination_fee_cap': 100000,   # 조기 해지 수수료 상한
+    'same_vendor_penalty': 20000,    # 동일 벤더 재계약 페널티
+    'expiry_bonus_rate': 0.05,       # 만기 임박 보너스 비율
+    'bundle_bonus': 50000,           # internet + mobile 번들 보너스
+}
+
+
+def resolve_rule_params(params: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    기본 룰 파라미터에 사용자 지정 값을 덮어써서 반환
+
+    공개 룰 함수는 일부 키만 지정한 파라미터도 받을 수 있도록 각자 정규화한다.
+    전체 사용자 최적화(evaluate_population)는 한 번만 정규화하고 아래 룰 헬퍼에 개별 값을 전달한다.
+    """
+    resolved = dict(DEFAULT_RULE_PARAMS)
+    if params:
+        unknown = set(params) - set(DEFAULT_RULE_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown rule params: {sorted(unknown)}")
+        resolved.update(params)
+    return resolved
+
+
+def to_as_of_date(as_of: AsOf = None) -> date:
+    """
+    기준일을 date로 정규화 (None이면 오늘)
+
+    실행 단위 기준일(Airflow logical date)을 모든 룰에 동일하게 전달하기 위해 사용한다.
+    """
+    if as_of is None:
+        return date.today()
+    if isinstance(as_of, datetime):
+        return as_of.date()
+    if isinstance(as_of, date):
+        return as_of
+    return datetime.strptime(str(as_of)[:10], "%Y-%m-%d").date()
+
+
+@lru_cache(maxsize=None)
+def parse_end_date(end_date: str) -> date:
+    """
+    계약 만료일 문자열 파싱 (동일 문자열은 캐시)
+    """
+    return datetime.strptime(end_date, "%Y-%m-%d").date()
+
+
+def days_until(end_date: str, as_of: AsOf = None) -> int:
+    """
+    기준일부터 계약 만료일까지 남은 일수
+    """
+    return (parse_end_date(end_date) - to_as_of_date(as_of)).days
+
+
+def is_new_customer_only(offer: Dict[str, Any]) -> bool:
+    """
+    신규 고객 전용 오퍼 여부
+    """
+    return "new_customer_only" in offer.get('conditions', [])
+
+
+def is_locked_in(days_remaining: int, expiry_window_days: int) -> bool:
+    """
+    기존 계약 만료가 아직 멀어 전환할 수 없는지 여부 (만료 임박 기준 일수 초과)
+    """
+    return days_remaining > expiry_window_days
+
+
+def is_expiring_soon(days_remaining: int, expiry_window_days: int) -> bool:
+    """
+    만기 임박 보너스 대상 여부 (0일 이상, 만료 임박 기준 일수 이내)
+    """
+    return 0 <= days_remaining <= expiry_window_days
+
+
+def early_termination_fee(monthly_fee: int, days_remaining: int, termination_fee_cap: int) -> int:
+    """
+    조기 해지 수수료 (남은 기간에 비례, 상한 적용)
+    """
+    if days_remaining <= 0:
+        return 0
+    return min(termination_fee_cap, monthly_fee * (days_remaining // 30))
+
+
+def check_eligibility(offer: Dict[str, Any], contracts: List[Dict[str, Any]], user_id: str = "u001",
+                      params: Dict[str, Any] = None, as_of: AsOf = None) -> bool:
     """
     사용자가 특정 오퍼에 대해 자격이 있는지 확인
     """
+    params = resolve_rule_params(params)
+    as_of = to_as_of_date(as_of)
+    
     # 동일 카테고리 기존 계약 확인
     existing_contracts = [c for c in contracts if c['user_id'] == user_id and c['category'] == offer['category']]
     
     # new_customer_only 조건 확인
-    if "new_customer_only" in offer.get('conditions', []):
+    if is_new_customer_only(offer):
         if existing_contracts:
             return False
     
-    # 만료 임박 확인 (60일 이내)
+    # 만료 임박 확인 (기본 60일 이내)
     for contract in existing_contracts:
-        end_date = datetime.strptime(contract['end_date'], "%Y-%m-%d")
-        if (end_date - datetime.now()).days > 60:
+        if is_locked_in(days_until(contract['end_date'], as_of), params['expiry_window_days']):
             return False  # 아직 만료가 멀음
     
     return True
 
 
-def calculate_switching_cost(offer: Dict[str, Any], contracts: List[Dict[str, Any]], user_id: str = "u001") -> int:
+def calculate_switching_cost(offer: Dict[str, Any], contracts: List[Dict[str, Any]], user_id: str = "u001",
+                             params: Dict[str, Any] = None, as_of: AsOf = None) -> int:
     """
     기존 계약에서 전환 시 발생하는 비용 계산
     """
+    params = resolve_rule_params(params)
+    as_of = to_as_of_date(as_of)
     switching_cost = 0
     
     # 동일 카테고리 기존 계약 찾기
     existing_contracts = [c for c in contracts if c['user_id'] == user_id and c['category'] == offer['category']]
     
     for contract in existing_contracts:
-        end_date = datetime.strptime(contract['end_date'], "%Y-%m-%d")
-        days_remaining = (end_date - datetime.now()).days
+        days_remaining = days_until(contract['end_date'], as_of)
         
         # 조기 해지 수수료 (남은 기간에 비례)
-        if days_remaining > 0:
-            early_termination_fee = min(100000, contract['monthly_fee'] * (days_remaining // 30))
-            switching_cost += early_termination_fee
+        switching_cost += early_termination_fee(contract['monthly_fee'], days_remaining, params['termination_fee_cap'])
     
     return switching_cost
 
 
-def calculate_same_vendor_penalty(offer: Dict[str, Any], contracts: List[Dict[str, Any]], user_id: str = "u001") -> int:
+def calculate_same_vendor_penalty(offer: Dict[str, Any], contracts: List[Dict[str, Any]], user_id: str = "u001",
+                                  params: Dict[str, Any] = None, *, vendor_catalog: VendorCatalog) -> int:
     """
     동일 벤더 재계약 시 페널티 계산
+
+    vendor_catalog는 실행 단위로 한 번 만든 카탈로그를 전달한다 (호출마다 별칭 인덱스를 다시 만들지 않도록 필수 인자).
     """
-    # 오퍼에서 벤더 추출 (name에서 첫 번째 단어)
-    offer_vendor = offer['name'].split()[0]
+    params = resolve_rule_params(params)
+    
+    # 오퍼 벤더 ID (별칭 테이블 기준, 오퍼 ID 단위 캐시)
+    offer_vendor_id = vendor_catalog.offer_vendor_id(offer)
     
     # 동일 카테고리, 동일 벤더 기존 계약 확인
     same_vendor_contracts = [
         c for c in contracts 
         if c['user_id'] == user_id 
         and c['category'] == offer['category'] 
-        and c['vendor'].upper() == offer_vendor.upper()
+        and vendor_catalog.contract_vendor_id(c) == offer_vendor_id
     ]
     
-    if same_vendor_contracts:
-        return 20000  # 고정 페널티
-    
-    return 0
+    # 고정 페널티
+    return params['same_vendor_penalty'] if same_vendor_contracts else 0
 
 
-def calculate_expiry_bonus(contracts: List[Dict[str, Any]], user_id: str = "u001") -> float:
+def calculate_expiry_bonus(contracts: List[Dict[str, Any]], user_id: str = "u001",
+                           params: Dict[str, Any] = None, as_of: AsOf = None) -> float:
     """
     만기 임박 보너스 계산 (총혜택에 5% 가산)
     """
+    params = resolve_rule_params(params)
+    as_of = to_as_of_date(as_of)
+    
     for contract in contracts:
         if contract['user_id'] == user_id:
-            end_date = datetime.strptime(contract['end_date'], "%Y-%m-%d")
-            days_remaining = (end_date - datetime.now()).days
+            days_remaining = days_until(contract['end_date'], as_of)
             
-            if 0 <= days_remaining <= 60:
-                return 0.05  # 5% 보너스
+            if is_expiring_soon(days_remaining, params['expiry_window_days']):
+                return params['expiry_bonus_rate']  # 기본 5% 보너스
     
     return 0.0
 
 
-def calculate_bundle_bonus(selected_offers: List[Dict[str, Any]]) -> int:
+def calculate_bundle_bonus(selected_offers: List[Dict[str, Any]], params: Dict[str, Any] = None) -> int:
     """
     번들 보너스 계산 (internet + mobile 조합 시 +50,000원)
     """
+    params = resolve_rule_params(params)
     categories = {offer['category'] for offer in selected_offers}
     
     if 'internet' in categories and 'mobile' in categories:
-        return 50000
+        return params['bundle_bonus']
     
     return 0
 
 
-def deduplicate_offers(offers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def deduplicate_offers(offers: List[Dict[str, Any]], vendor_catalog: VendorCatalog = None) -> List[Dict[str, Any]]:
     """
     중복 오퍼 제거 (같은 ID 기준)
+    
+    vendor_catalog가 주어지면 벤더 표기만 다른 동일 상품(같은 지문)도 중복으로 제거한다.
     """
     seen_ids = set()
+    seen_fingerprints = set()
     unique_offers = []
     
     for offer in offers:
-        if offer['id'] not in seen_ids:
-            unique_offers.append(offer)
-            seen_ids.add(offer['id'])
+        if offer['id'] in seen_ids:
+            continue
+        if vendor_catalog is not None:
+            fingerprint = vendor_catalog.offer_fingerprint(offer)
+            if fingerprint in seen_fingerprints:
+                continue
+            seen_fingerprints.add(fingerprint)
+        unique_offers.append(offer)
+        seen_ids.add(offer['id'])
     
     return unique_offers
 
@@ -0,0 +1,215 @@
+"""
+Scenario simulation engine for Ajd Benefit Optimizer
+룰 파라미터/기준일/오퍼 변경 시나리오 일괄 평가 (what-if 시뮬레이션)
+
+scoring.py 의 프로필 단위 최적화(DAG와 동일한 경로)를 그대로 사용하되,
+계약 피처와 프로필 그룹을 한 번만 만들어 두고 여러 시나리오에서 재사용한다.
+일수 계산은 기준일(as_of)의 날짜 단위로 수행한다.
+"""
+import argparse
+import json
+from collections import Counter
+from typing import Dict, List, Any
+
+from .rules import AsOf, to_as_of_date, resolve_rule_params, validate_offer_data, deduplicate_offers
+from .scoring import build_contract_features, build_offer_catalog, evaluate_profile, group_user_profiles
+from .vendors import VendorCatalog, build_vendor_catalog, load_vendor_aliases
+
+# 시나리오에서 변경 가능한 오퍼 필드 (스코어링 공식이 읽는 필드만 허용, base_fee 등은 결과에 영향이 없음)
+PERTURBABLE_FIELDS = ('benefit_cash', 'benefit_coupon')
+
+
+def apply_perturbations(offers: List[Dict[str, Any]], perturbations: List[Dict[str, Any]],
+                        vendor_catalog: VendorCatalog) -> List[Dict[str, Any]]:
+    """
+    오퍼 변경 시나리오 적용 (원본은 수정하지 않음)
+
+    perturbation 예시:
+        {'vendor': 'KT', 'field': 'benefit_cash', 'multiplier': 1.1}
+        {'offer_id': 'kt_1g_36m', 'field': 'benefit_coupon', 'delta': 10000}
+    선택자(offer_id / vendor / category)를 생략하면 전체 오퍼에 적용된다.
+    vendor는 벤더 카탈로그에 등록된 벤더명/별칭이어야 한다 (오타로 빈 시나리오가 되지 않도록).
+    """
+    if not perturbations:
+        return offers
+
+    for perturbation in perturbations:
+        if perturbation.get('field') not in PERTURBABLE_FIELDS:
+            raise ValueError(
+                f"Unsupported perturbation field: {perturbation.get('field')} "
+                f"(scoring only reads {', '.join(PERTURBABLE_FIELDS)})"
+            )
+
+    vendor_ids = []
+    for perturbation in perturbations:
+        if 'vendor' not in perturbation:
+            vendor_ids.append(None)
+            continue
+        vendor_id = vendor_catalog.find_vendor_id(perturbation['vendor'])
+        if vendor_id is None:
+            raise ValueError(f"Unknown perturbation vendor: {perturbation['vendor']}")
+        vendor_ids.append(vendor_id)
+
+    perturbed = []
+    for offer in offers:
+        changed = None
+        for perturbation, vendor_id in zip(perturbations, vendor_ids):
+            if 'offer_id' in perturbation and perturbation['offer_id'] != offer['id']:
+                continue
+            if 'category' in perturbation and perturbation['category'] != offer['category']:
+                continue
+            if vendor_id is not None and vendor_id != vendor_catalog.offer_vendor_id(offer):
+                continue
+
+            if changed is None:
+                changed = dict(offer)
+            field = perturbation['field']
+            value = changed.get(field, 0) * perturbation.get('multiplier', 1) + perturbation.get('delta', 0)
+            changed[field] = int(round(value))
+
+        perturbed.append(changed if changed is not None else offer)
+
+    return perturbed
+
+
+def summarize_population(results: Dict[Any, Dict[str, Any]], weights: Dict[Any, int] = None) -> Dict[str, Any]:
+    """
+    사용자별 최적화 결과를 시나리오 KPI로 요약
+
+    weights가 주어지면 results의 각 항목(프로필)을 해당 사용자 수만큼 집계한다.
+    """
+    users = 0
+    total_benefit = 0
+    users_with_selection = 0
+    bundle_users = 0
+    selection_counts = Counter()
+
+    for key, result in results.items():
+        weight = weights[key] if weights else 1
+        users += weight
+        total_benefit += result['total_score'] * weight
+        if result['selected_count']:
+            users_with_selection += weight
+        if result['bundle_bonus']:
+            bundle_users += weight
+        for offer in result['selected_offers']:
+            selection_counts[offer['id']] += weight
+
+    return {
+        'users': users,
+        'users_with_selection': users_with_selection,
+        'total_benefit': total_benefit,
+        'avg_benefit': total_benefit / users if users else 0,
+        'bundle_users': bundle_users,
+        'bundle_uptake': bundle_users / users * 100 if users else 0,
+        'selection_counts': dict(selection_counts)
+    }
+
+
+def _kpi_deltas(kpis: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    시나리오 KPI와 기준 KPI의 차이 계산
+    """
+    deltas = {
+        key: kpis[key] - baseline[key]
+        for key in kpis if key != 'selection_counts'
+    }
+    offer_ids = set(kpis['selection_counts']) | set(baseline['selection_counts'])
+    deltas['selection_counts'] = {
+        offer_id: kpis['selection_counts'].get(offer_id, 0) - baseline['selection_counts'].get(offer_id, 0)
+        for offer_id in sorted(offer_ids)
+    }
+    return deltas
+
+
+def run_scenarios(offers: List[Dict[str, Any]], contracts: List[Dict[str, Any]], scenarios: List[Dict[str, Any]],
+                  as_of: AsOf = None, baseline_params: Dict[str, Any] = None,
+                  vendor_catalog: VendorCatalog = None) -> List[Dict[str, Any]]:
+    """
+    여러 시나리오를 동일한 데이터에 대해 일괄 평가
+
+    scenario 예시:
+        {'name': 'kt_cash_up_10', 'as_of': '2025-09-01',
+         'params': {'bundle_bonus': 70000},
+         'perturbations': [{'vendor': 'KT', 'field': 'benefit_cash', 'multiplier': 1.1}]}
+    각 시나리오 결과에는 같은 기준일의 baseline(기본 파라미터, 변경 없음) 대비 KPI 차이가 포함된다.
+    """
+    vendor_catalog = vendor_catalog or build_vendor_catalog(offers, contracts)
+    contract_features = build_contract_features(contracts, vendor_catalog)
+    base_catalog = build_offer_catalog(offers, vendor_catalog)
+    categories = list(base_catalog.keys())
+
+    # 프로필 그룹은 기준일과 일부 파라미터에만 의존하므로 시나리오 간 공유
+    profile_groups = {}
+    baselines = {}
+    scenario_results = []
+
+    def summarize(catalog, scenario_as_of, params):
+        group_key = (scenario_as_of, params['expiry_window_days'], params['termination_fee_cap'])
+        if group_key not in profile_groups:
+            groups = group_user_profiles(contract_features, categories, scenario_as_of, params)
+            profile_groups[group_key] = {profile: len(users) for profile, users in groups.items()}
+        weights = profile_groups[group_key]
+        results = {profile: evaluate_profile(profile, catalog, params) for profile in weights}
+        return summarize_population(results, weights)
+
+    for index, scenario in enumerate(scenarios):
+        scenario_as_of = to_as_of_date(scenario.get('as_of', as_of))
+        params = resolve_rule_params({**(baseline_params or {}), **(scenario.get('params') or {})})
+
+        if scenario_as_of not in baselines:
+            baselines[scenario_as_of] = summarize(base_catalog, scenario_as_of, resolve_rule_params(baseline_params))
+
+        perturbations = scenario.get('perturbations')
+        if perturbations:
+            catalog = build_offer_catalog(apply_perturbations(offers, perturbations, vendor_catalog), vendor_catalog)
+        else:
+            catalog = base_catalog
+        kpis = summarize(catalog, scenario_as_of, params)
+
+        scenario_results.append({
+            'name': scenario.get('name', f"scenario_{index + 1}"),
+            'as_of': scenario_as_of.isoformat(),
+            'params': params,
+            'kpis': kpis,
+            'deltas': _kpi_deltas(kpis, baselines[scenario_as_of])
+        })
+
+    return scenario_results
+
+
+def main(argv: List[str] = None) -> None:
+    """
+    CLI: python -m lib.scenario --offers-dir ... --contracts-dir ... --scenarios scenarios.json
+    """
+    from .io_utils import load_json_files
+
+    parser = argparse.ArgumentParser(description='아정당 혜택 최적화 시나리오 시뮬레이션')
+    parser.add_argument('--offers-dir', required=True)
+    parser.add_argument('--contracts-dir', required=True)
+    parser.add_argument('--scenarios', required=True, help='시나리오 목록 JSON 파일')
+    parser.add_argument('--as-of', default=None, help='기본 기준일 (YYYY-MM-DD)')
+    parser.add_argument('--output', default=None, help='결과 JSON 파일 경로 (생략 시 stdout)')
+    parser.add_argument('--vendor-aliases', default=None, help='벤더 별칭 테이블 JSON 파일')
+    args = parser.parse_args(argv)
+
+    offers_valid = validate_offer_data(load_json_files(args.offers_dir))
+    contracts = load_json_files(args.contracts_dir)
+    vendor_catalog = build_vendor_catalog(offers_valid, contracts, load_vendor_aliases(args.vendor_aliases))
+    offers = deduplicate_offers(offers_valid, vendor_catalog)
+    with open(args.scenarios, 'r', encoding='utf-8') as f:
+        scenarios = json.load(f)
+
+    results = run_scenarios(offers, contracts, scenarios, as_of=args.as_of, vendor_catalog=vendor_catalog)
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"Scenario results exported to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
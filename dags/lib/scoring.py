@@ -1,105 +1,256 @@
 """
 Scoring and optimization logic for Ajd Benefit Optimizer
 스코어링 및 최적화 로직
+
+계약 데이터는 사용자별 피처(contract features)로 한 번만 파싱하고, 오퍼는 카테고리별 카탈로그로 미리 계산한다.
+최적 조합은 사용자 프로필 단위로 계산하므로 동일 프로필 사용자는 한 번만 평가된다.
 """
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 from itertools import combinations
+from urllib.parse import quote
 from .rules import (
-    check_eligibility, calculate_switching_cost, calculate_same_vendor_penalty,
-    calculate_expiry_bonus, calculate_bundle_bonus
+    AsOf, to_as_of_date, parse_end_date, resolve_rule_params, calculate_switching_cost,
+    calculate_same_vendor_penalty, calculate_expiry_bonus, calculate_bundle_bonus,
+    is_new_customer_only, is_locked_in, is_expiring_soon, early_termination_fee
 )
+from .vendors import VendorCatalog, build_vendor_catalog
 
 
-def calculate_offer_score(offer: Dict[str, Any], contracts: List[Dict[str, Any]], user_id: str = "u001") -> Tuple[int, Dict[str, Any]]:
+def offer_total_benefit(base_benefit: int, switching_cost: int, same_vendor_penalty: int,
+                        expiry_bonus_rate: float) -> int:
+    """
+    총혜택 = benefit_cash + benefit_coupon - switching_cost - penalty + bonus
+    """
+    return base_benefit - switching_cost - same_vendor_penalty + int(base_benefit * expiry_bonus_rate)
+
+
+def build_score_details(base_benefit: int, switching_cost: int, same_vendor_penalty: int,
+                        expiry_bonus_rate: float) -> Dict[str, Any]:
+    """
+    오퍼 스코어 세부사항 계산
+    """
+    return {
+        'base_benefit': base_benefit,
+        'switching_cost': switching_cost,
+        'same_vendor_penalty': same_vendor_penalty,
+        'expiry_bonus': int(base_benefit * expiry_bonus_rate),
+        'total_benefit': offer_total_benefit(base_benefit, switching_cost, same_vendor_penalty, expiry_bonus_rate)
+    }
+
+
+def assemble_optimization_result(category_scores: Dict[str, Dict[str, Any]], params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    카테고리별 최고 스코어 오퍼로 최적화 결과 구성 (번들 보너스 적용)
+    """
+    selected_offers = [score_info['offer'] for score_info in category_scores.values()]
+    bundle_bonus = calculate_bundle_bonus(selected_offers, params)
+    total_score = sum(score_info['score'] for score_info in category_scores.values()) + bundle_bonus
+    
+    return {
+        'selected_offers': selected_offers,
+        'total_score': total_score,
+        'bundle_bonus': bundle_bonus,
+        'category_scores': category_scores,
+        'selected_count': len(selected_offers)
+    }
+
+
+def calculate_offer_score(offer: Dict[str, Any], contracts: List[Dict[str, Any]], user_id: str = "u001",
+                          params: Dict[str, Any] = None, as_of: AsOf = None, *,
+                          vendor_catalog: VendorCatalog) -> Tuple[int, Dict[str, Any]]:
     """
     개별 오퍼의 스코어 계산
     총혜택 = benefit_cash + benefit_coupon - switching_cost - penalty + bonus
+
+    vendor_catalog는 호출 측에서 한 번 만든 카탈로그를 전달한다 (예: build_vendor_catalog(offers, contracts)).
     """
     # 기본 혜택
     base_benefit = offer['benefit_cash'] + offer.get('benefit_coupon', 0)
     
     # 비용 계산
-    switching_cost = calculate_switching_cost(offer, contracts, user_id)
-    same_vendor_penalty = calculate_same_vendor_penalty(offer, contracts, user_id)
+    switching_cost = calculate_switching_cost(offer, contracts, user_id, params, as_of)
+    same_vendor_penalty = calculate_same_vendor_penalty(offer, contracts, user_id, params, vendor_catalog=vendor_catalog)
     
     # 보너스 계산
-    expiry_bonus_rate = calculate_expiry_bonus(contracts, user_id)
-    expiry_bonus = int(base_benefit * expiry_bonus_rate)
+    expiry_bonus_rate = calculate_expiry_bonus(contracts, user_id, params, as_of)
     
     # 총 혜택 계산
-    total_benefit = base_benefit - switching_cost - same_vendor_penalty + expiry_bonus
-    
-    # 스코어 세부사항
-    score_details = {
-        'base_benefit': base_benefit,
-        'switching_cost': switching_cost,
-        'same_vendor_penalty': same_vendor_penalty,
-        'expiry_bonus': expiry_bonus,
-        'total_benefit': total_benefit
-    }
+    score_details = build_score_details(base_benefit, switching_cost, same_vendor_penalty, expiry_bonus_rate)
     
-    return total_benefit, score_details
+    return score_details['total_benefit'], score_details
 
 
-def find_optimal_combination(offers: List[Dict[str, Any]], contracts: List[Dict[str, Any]], user_id: str = "u001") -> Dict[str, Any]:
+def build_contract_features(contracts: List[Dict[str, Any]],
+                            vendor_catalog: VendorCatalog) -> Dict[str, Dict[str, Any]]:
     """
-    카테고리별 최대 1개 선택 제약 하에서 최적 조합 찾기
+    계약 데이터를 사용자별로 한 번만 파싱하여 스코어링용 피처로 변환
+
+    벤더 ID가 오퍼 카탈로그와 일치해야 하므로 build_offer_catalog와 같은 vendor_catalog를 전달한다.
+    """
+    features = {}
+
+    for contract in contracts:
+        user = features.setdefault(contract['user_id'], {'categories': {}, 'end_ordinals': []})
+        end_ordinal = parse_end_date(contract['end_date']).toordinal()
+
+        user['categories'].setdefault(contract['category'], []).append({
+            'vendor_id': vendor_catalog.contract_vendor_id(contract),
+            'end_ordinal': end_ordinal,
+            'monthly_fee': contract['monthly_fee']
+        })
+        user['end_ordinals'].append(end_ordinal)
+
+    return features
+
+
+def build_offer_catalog(offers: List[Dict[str, Any]],
+                        vendor_catalog: VendorCatalog) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    오퍼를 카테고리별로 그룹화하고 스코어링에 필요한 값을 미리 계산
     """
-    # 카테고리별로 오퍼 그룹화
-    offers_by_category = {}
+    catalog = {}
+
     for offer in offers:
-        category = offer['category']
-        if category not in offers_by_category:
-            offers_by_category[category] = []
-        offers_by_category[category].append(offer)
-    
-    # 카테고리별 최고 스코어 오퍼 선택
-    selected_offers = []
-    total_score = 0
+        catalog.setdefault(offer['category'], []).append({
+            'offer': offer,
+            'base_benefit': offer['benefit_cash'] + offer.get('benefit_coupon', 0),
+            'vendor_id': vendor_catalog.offer_vendor_id(offer),
+            'new_customer_only': is_new_customer_only(offer)
+        })
+
+    return catalog
+
+
+def _user_profile(user_features: Optional[Dict[str, Any]], categories: List[str], as_of_ordinal: int,
+                  params: Dict[str, Any]) -> Tuple:
+    """
+    스코어링 결과를 결정하는 사용자 상태 요약 (동일 프로필 사용자는 결과가 같음)
+    """
+    if not user_features:
+        return (False,) + tuple((False, False, 0, frozenset()) for _ in categories)
+
+    expiry_window_days = params['expiry_window_days']
+    expiring = any(is_expiring_soon(end - as_of_ordinal, expiry_window_days) for end in user_features['end_ordinals'])
+
+    category_states = []
+    for category in categories:
+        existing = user_features['categories'].get(category, [])
+        blocked = False
+        switching_cost = 0
+        for contract in existing:
+            days_remaining = contract['end_ordinal'] - as_of_ordinal
+            if is_locked_in(days_remaining, expiry_window_days):
+                blocked = True  # 아직 만료가 멀음
+            switching_cost += early_termination_fee(contract['monthly_fee'], days_remaining, params['termination_fee_cap'])
+        category_states.append((
+            bool(existing), blocked, switching_cost, frozenset(c['vendor_id'] for c in existing)
+        ))
+
+    return (expiring,) + tuple(category_states)
+
+
+def evaluate_profile(profile: Tuple, catalog: Dict[str, List[Dict[str, Any]]], params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    프로필 단위 최적 조합 계산 (find_optimal_combination과 동일한 결과 형태)
+    """
+    params = resolve_rule_params(params)
+    expiry_bonus_rate = params['expiry_bonus_rate'] if profile[0] else 0.0
+    penalty = params['same_vendor_penalty']
+
     category_scores = {}
-    
-    for category, category_offers in offers_by_category.items():
-        best_offer = None
+
+    for (category, entries), state in zip(catalog.items(), profile[1:]):
+        has_existing, blocked, switching_cost, vendors = state
+        if blocked:
+            continue
+
+        best_entry = None
         best_score = -float('inf')
-        best_details = None
-        
-        for offer in category_offers:
-            # 자격 확인
-            if not check_eligibility(offer, contracts, user_id):
+        best_penalty = 0
+
+        for entry in entries:
+            if entry['new_customer_only'] and has_existing:
                 continue
-            
-            score, details = calculate_offer_score(offer, contracts, user_id)
-            
+
+            same_vendor_penalty = penalty if entry['vendor_id'] in vendors else 0
+            score = offer_total_benefit(entry['base_benefit'], switching_cost, same_vendor_penalty, expiry_bonus_rate)
+
             if score > best_score:
                 best_score = score
-                best_offer = offer
-                best_details = details
-        
-        if best_offer:
-            selected_offers.append(best_offer)
-            total_score += best_score
+                best_entry = entry
+                best_penalty = same_vendor_penalty
+
+        if best_entry:
             category_scores[category] = {
-                'offer': best_offer,
+                'offer': best_entry['offer'],
                 'score': best_score,
-                'details': best_details
+                'details': build_score_details(best_entry['base_benefit'], switching_cost, best_penalty, expiry_bonus_rate)
             }
+
+    return assemble_optimization_result(category_scores, params)
+
+
+def group_user_profiles(contract_features: Dict[str, Dict[str, Any]], categories: List[str], as_of: AsOf = None,
+                        params: Dict[str, Any] = None, user_ids: List[str] = None) -> Dict[Tuple, List[str]]:
+    """
+    사용자를 프로필별로 그룹화 (기준일, 만료 기준 일수, 해지 수수료 상한에만 의존)
+    """
+    params = resolve_rule_params(params)
+    as_of_ordinal = to_as_of_date(as_of).toordinal()
+
+    if user_ids is None:
+        user_ids = list(contract_features.keys())
+
+    groups = {}
+    for user_id in user_ids:
+        profile = _user_profile(contract_features.get(user_id), categories, as_of_ordinal, params)
+        groups.setdefault(profile, []).append(user_id)
+
+    return groups
+
+
+def evaluate_population(contract_features: Dict[str, Dict[str, Any]], catalog: Dict[str, List[Dict[str, Any]]],
+                        as_of: AsOf = None, params: Dict[str, Any] = None,
+                        user_ids: List[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    전체 사용자에 대해 최적 조합 계산 (동일 프로필 사용자는 한 번만 계산)
+    """
+    params = resolve_rule_params(params)
+    groups = group_user_profiles(contract_features, list(catalog.keys()), as_of, params, user_ids)
+
+    results = {}
+    for profile, profile_users in groups.items():
+        result = evaluate_profile(profile, catalog, params)
+        for user_id in profile_users:
+            results[user_id] = result
+
+    return results
+
+
+def find_optimal_combination(offers: List[Dict[str, Any]], contracts: List[Dict[str, Any]], user_id: str = "u001",
+                             params: Dict[str, Any] = None, as_of: AsOf = None,
+                             vendor_catalog: VendorCatalog = None) -> Dict[str, Any]:
+    """
+    카테고리별 최대 1개 선택 제약 하에서 최적 조합 찾기
+
+    전체 사용자 최적화(evaluate_population)와 같은 프로필 경로로 계산하므로 두 결과는 항상 일치한다.
+    vendor_catalog를 생략하면 이번 호출의 오퍼/계약으로 카탈로그를 새로 만든다.
+    """
+    user_contracts = [c for c in contracts if c['user_id'] == user_id]
+    vendor_catalog = vendor_catalog or build_vendor_catalog(offers, user_contracts)
     
-    # 번들 보너스 적용
-    bundle_bonus = calculate_bundle_bonus(selected_offers)
-    total_score += bundle_bonus
-    
-    return {
-        'selected_offers': selected_offers,
-        'total_score': total_score,
-        'bundle_bonus': bundle_bonus,
-        'category_scores': category_scores,
-        'selected_count': len(selected_offers)
-    }
+    return evaluate_population(
+        build_contract_features(user_contracts, vendor_catalog), build_offer_catalog(offers, vendor_catalog),
+        as_of, params, user_ids=[user_id]
+    )[user_id]
 
 
-def calculate_kpi_metrics(offers: List[Dict[str, Any]], optimization_result: Dict[str, Any]) -> Dict[str, Any]:
+def calculate_kpi_metrics(offers: List[Dict[str, Any]], optimization_result: Dict[str, Any],
+                          population: Dict[str, Any] = None) -> Dict[str, Any]:
     """
     KPI 메트릭 계산
+
+    population(KpiAggregator.summary())이 주어지면 오퍼 통계는 스트리밍 집계 결과를 사용한다.
     """
     # 카테고리별 분석
     category_breakdown = {}
@@ -112,10 +263,15 @@ def calculate_kpi_metrics(offers: List[Dict[str, Any]], optimization_result: Dic
         }
     
     # 전체 통계
-    total_offers = len(offers)
-    unique_ids = set(offer['id'] for offer in offers)
-    unique_offers = len(unique_ids)
-    dup_rate = ((total_offers - unique_offers) / total_offers * 100) if total_offers > 0 else 0
+    if population:
+        total_offers = population['total_offers']
+        unique_offers = population['unique_offers']
+        dup_rate = population['dup_rate']
+    else:
+        total_offers = len(offers)
+        unique_ids = set(offer['id'] for offer in offers)
+        unique_offers = len(unique_ids)
+        dup_rate = ((total_offers - unique_offers) / total_offers * 100) if total_offers > 0 else 0
     
     kpi_data = {
         'total_offers': total_offers,
@@ -124,29 +280,41 @@ def calculate_kpi_metrics(offers: List[Dict[str, Any]], optimization_result: Dic
         'best_total_benefit': optimization_result['total_score'],
         'selected_offers_count': optimization_result['selected_count'],
         'bundle_bonus': optimization_result['bundle_bonus'],
-        'category_breakdown': category_breakdown
+        'category_breakdown': category_breakdown,
+        'population': population
     }
     
     return kpi_data
 
 
-def prepare_recommendations_data(optimization_result: Dict[str, Any], user_id: str = "u001") -> List[Dict[str, Any]]:
+def make_recommendation_id(as_of: AsOf, user_id: str, category: str) -> str:
+    """
+    기준일/사용자/카테고리로 결정적인 추천 ID 생성
+
+    각 구성요소를 percent-encoding 하므로 ID에 구분자(:)가 포함되어도 충돌하지 않는다.
+    """
+    parts = [to_as_of_date(as_of).strftime('%Y%m%d'), str(user_id), str(category)]
+    return ':'.join(quote(part, safe='') for part in parts)
+
+
+def prepare_recommendations_data(optimization_result: Dict[str, Any], user_id: str = "u001",
+                                 as_of: AsOf = None) -> List[Dict[str, Any]]:
     """
-    추천 결과를 저장용 형태로 변환
+    추천 결과를 저장용 형태로 변환 (같은 기준일 재실행 시 동일한 결과)
     """
-    from datetime import datetime
+    as_of = to_as_of_date(as_of)
     
     recommendations = []
     
     for offer in optimization_result['selected_offers']:
         rec = {
-            'recommendation_id': f"{user_id}_{offer['category']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            'recommendation_id': make_recommendation_id(as_of, user_id, offer['category']),
             'user_id': user_id,
             'offer_id': offer['id'],
             'offer_name': offer['name'],
             'category': offer['category'],
             'total_benefit': optimization_result['category_scores'][offer['category']]['details']['total_benefit'],
-            'created_at': datetime.now().isoformat()
+            'created_at': as_of.isoformat()
         }
         recommendations.append(rec)
     
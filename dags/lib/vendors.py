@@ -0,0 +1,199 @@
+"""
+Vendor catalog for Ajd Benefit Optimizer
+오퍼/계약의 벤더 표기를 정수 벤더 ID로 정규화하는 별칭 인덱스
+
+실행마다 한 번 생성하여 동일 벤더 페널티, 중복 오퍼 지문, KPI 벤더 집계에 공통으로 사용한다.
+벤더 비교는 정수 비교 한 번으로 끝난다.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+# 정규 벤더명 -> 별칭 목록 (대소문자/공백 차이는 무시)
+DEFAULT_VENDOR_ALIASES = {
+    'SKT': ['SKT', 'SK텔레콤', 'SK Telecom'],
+    'KT': ['KT'],
+    'LG U+': ['LG U+', 'LGU+', 'U+', 'LG유플러스'],
+    'LG': ['LG', 'LG전자'],
+    'Coway': ['Coway', '코웨이'],
+    'Samsung': ['Samsung', '삼성', '삼성전자'],
+}
+
+
+def normalize_vendor_text(text: str) -> str:
+    """
+    별칭 비교용 정규화 (소문자, 연속 공백 축약)
+    """
+    return ' '.join(str(text).split()).casefold()
+
+
+class VendorCatalog:
+    """
+    벤더 별칭 -> 정수 벤더 ID 인덱스
+
+    오퍼는 명시적 'vendor' 필드가 있으면 그 값을, 없으면 상품명 앞부분과 가장 길게 일치하는 별칭을 사용한다.
+    (예: "LG U+ 500M" -> LG U+, "LG 에어컨 렌탈" -> LG)
+    별칭 테이블에 없는 벤더는 처음 등장할 때 새 ID를 부여한다.
+    같은 별칭이 여러 벤더에 등록되어 있으면 테이블에서 뒤에 오는 벤더가 우선한다.
+    """
+
+    def __init__(self, aliases: Dict[str, List[str]] = None):
+        self.names = []           # 벤더 ID -> 정규 벤더명
+        self.alias_ids = {}       # 정규화된 별칭 -> 벤더 ID
+        self.offer_ids = {}       # 오퍼 ID -> 벤더 ID
+        self._raw_ids = {}        # 원본 벤더 문자열 -> 벤더 ID (정규화 생략용 캐시)
+        self._prefixes = []       # (정규화된 별칭, 벤더 ID), 긴 별칭 우선
+
+        for name, vendor_aliases in (aliases if aliases is not None else DEFAULT_VENDOR_ALIASES).items():
+            vendor_id = len(self.names)
+            self.names.append(name)
+            for alias in [name, *vendor_aliases]:
+                self.alias_ids[normalize_vendor_text(alias)] = vendor_id
+        self._rebuild_prefixes()
+
+    def _register(self, name: str) -> int:
+        key = normalize_vendor_text(name)
+        if key in self.alias_ids:
+            return self.alias_ids[key]
+        vendor_id = len(self.names)
+        self.names.append(name)
+        self.alias_ids[key] = vendor_id
+        return vendor_id
+
+    def _rebuild_prefixes(self) -> None:
+        self._prefixes = sorted(self.alias_ids.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def vendor_id(self, vendor: str) -> int:
+        """
+        벤더명/별칭 -> 벤더 ID (미등록 벤더는 새로 등록)
+        """
+        if vendor in self._raw_ids:
+            return self._raw_ids[vendor]
+
+        key = normalize_vendor_text(vendor)
+        if key not in self.alias_ids:
+            self._register(' '.join(str(vendor).split()))
+            self._rebuild_prefixes()
+        self._raw_ids[vendor] = self.alias_ids[key]
+        return self._raw_ids[vendor]
+
+    def find_vendor_id(self, vendor: str) -> Optional[int]:
+        """
+        등록된 벤더명/별칭 -> 벤더 ID (미등록 벤더는 등록하지 않고 None)
+        """
+        if vendor in self._raw_ids:
+            return self._raw_ids[vendor]
+        return self.alias_ids.get(normalize_vendor_text(vendor))
+
+    def vendor_name(self, vendor_id: int) -> str:
+        return self.names[vendor_id]
+
+    def match_prefix(self, name: str) -> Tuple[Optional[int], str]:
+        """
+        상품명 앞부분과 일치하는 가장 긴 별칭 검색 -> (벤더 ID, 나머지 상품명)
+        """
+        text = normalize_vendor_text(name)
+        for alias, vendor_id in self._prefixes:
+            if text == alias:
+                return vendor_id, ''
+            if text.startswith(alias + ' '):
+                return vendor_id, text[len(alias) + 1:]
+        return None, text
+
+    def offer_vendor_id(self, offer: Dict[str, Any]) -> int:
+        """
+        오퍼 -> 벤더 ID (오퍼 ID 단위 캐시)
+        """
+        offer_id = offer.get('id')
+        if offer_id in self.offer_ids:
+            return self.offer_ids[offer_id]
+
+        if offer.get('vendor'):
+            vendor_id = self.vendor_id(offer['vendor'])
+        else:
+            vendor_id, _ = self.match_prefix(offer['name'])
+            if vendor_id is None:
+                vendor_id = self.vendor_id(offer['name'].split()[0])
+
+        if offer_id is not None:
+            self.offer_ids[offer_id] = vendor_id
+        return vendor_id
+
+    def contract_vendor_id(self, contract: Dict[str, Any]) -> int:
+        """
+        계약 -> 벤더 ID
+        """
+        return self.vendor_id(contract['vendor'])
+
+    def offer_vendor_name(self, offer: Dict[str, Any]) -> str:
+        return self.names[self.offer_vendor_id(offer)]
+
+    def offer_fingerprint(self, offer: Dict[str, Any]) -> Tuple:
+        """
+        중복 오퍼 판별용 지문 (벤더 ID + 벤더 표기를 제외한 상품명 + 조건)
+
+        같은 상품이 다른 ID나 벤더 표기("LGU+" / "LG U+")로 들어와도 동일한 지문을 갖는다.
+        """
+        vendor_id = self.offer_vendor_id(offer)
+        matched_id, product = self.match_prefix(offer['name'])
+        if matched_id != vendor_id:
+            product = normalize_vendor_text(offer['name'])
+
+        return (
+            vendor_id, offer['category'], product,
+            offer.get('base_fee'), offer.get('benefit_cash'), offer.get('benefit_coupon', 0),
+            offer.get('min_contract_months'), tuple(sorted(offer.get('conditions', [])))
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'names': self.names,
+            'alias_ids': self.alias_ids,
+            'offer_ids': self.offer_ids
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'VendorCatalog':
+        catalog = cls(aliases={})
+        catalog.names = list(data['names'])
+        catalog.alias_ids = dict(data['alias_ids'])
+        catalog.offer_ids = dict(data['offer_ids'])
+        catalog._rebuild_prefixes()
+        return catalog
+
+
+def load_vendor_aliases(path: str = None) -> Dict[str, List[str]]:
+    """
+    벤더 별칭 테이블 로드 (파일이 없으면 기본 테이블)
+
+    파일 항목은 기본 테이블보다 우선한다: 파일에서 다른 벤더에 지정한 별칭은 기본 벤더에서 제거되고,
+    파일 항목은 테이블 뒤쪽에 배치된다.
+    """
+    overrides = {}
+    if path and Path(path).exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            overrides = json.load(f)
+
+    claimed = {
+        normalize_vendor_text(alias)
+        for name, vendor_aliases in overrides.items() for alias in [name, *vendor_aliases]
+    }
+    aliases = {
+        name: [alias for alias in vendor_aliases if normalize_vendor_text(alias) not in claimed]
+        for name, vendor_aliases in DEFAULT_VENDOR_ALIASES.items() if name not in overrides
+    }
+    aliases.update({name: list(vendor_aliases) for name, vendor_aliases in overrides.items()})
+    return aliases
+
+
+def build_vendor_catalog(offers: List[Dict[str, Any]] = None, contracts: List[Dict[str, Any]] = None,
+                         aliases: Dict[str, List[str]] = None) -> VendorCatalog:
+    """
+    실행 단위 벤더 카탈로그 생성 (오퍼/계약 벤더를 미리 인덱싱)
+    """
+    catalog = VendorCatalog(aliases)
+    for offer in offers or []:
+        catalog.offer_vendor_id(offer)
+    for contract in contracts or []:
+        catalog.contract_vendor_id(contract)
+    return catalog